@@ -0,0 +1,128 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+from datasetPool import CACHE_DIR, DATASET_POOL
+from era5_plot import dataset_path, load_frame, render_frame, STATS_INDEX, TIME_NAME, LAT_NAME, LON_NAME
+from gridGeometry import grid_for
+
+EXPORT_FORMATS = ["gif", "webp", "mp4"]
+# Finished exports waiting to be downloaded
+EXPORT_DIR = Path(os.environ.get("EXPORT_DIR", CACHE_DIR / "exports"))
+# Slices read ahead of the frame being drawn
+EXPORT_READ_AHEAD = 4
+
+
+def _read_slices(ds, var_name, lev, times, grid, out, stop):
+    # Producer: one streaming pass over the time axis of an already open dataset
+    def put(item):
+        # Give up once the consumer has stopped, rather than block on a full queue
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for t in times:
+            if not put(load_frame(ds, var_name, t, lev, grid)):
+                return
+    except Exception as e:
+        put(e)
+    put(None)
+
+
+def _write_mp4(frames, path, fps):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("MP4 export needs ffmpeg on the PATH")
+    first = next(frames)
+    height, width = first.shape[:2]
+    cmd = [ffmpeg, "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps),
+           "-i", "-", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+           "-pix_fmt", "yuv420p", "-vcodec", "libx264", "-f", "mp4", str(path)]
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=err)
+        try:
+            proc.stdin.write(first.tobytes())
+            for frame in frames:
+                proc.stdin.write(frame.tobytes())
+            proc.stdin.close()
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.wait()
+        if proc.returncode != 0:
+            err.seek(0)
+            raise RuntimeError(f"ffmpeg failed: {err.read().decode(errors='replace')}")
+
+
+def _write_pil(frames, path, fmt, fps):
+    images = (Image.fromarray(f).convert("RGB") for f in frames)
+    first = next(images)
+    first.save(path, format=fmt.upper(), save_all=True, append_images=images,
+               duration=int(1000 / fps), loop=0)
+
+
+def export_animation(dataset: str, var_name: str, path, lev: int = 0, fmt: str = "gif", fps: int = 4,
+                     vmin=None, vmax=None, times=None) -> Path:
+    """Render a whole forecast (or the given time indices) into an animated GIF/WebP/MP4 at path.
+
+    The dataset is opened once and each time slice is read once; reading
+    the next slices overlaps with drawing the current one, and each frame
+    goes to the encoder as soon as it is drawn. Blocking: call it from a
+    worker thread.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+    path = Path(path)
+    dataset_dir = dataset_path(dataset)
+    if vmin is None or vmax is None:
+        vmin, vmax = STATS_INDEX.limits(dataset_dir, var_name, lev)
+
+    with DATASET_POOL.acquire(dataset_dir) as ds:
+        if times is None:
+            times = range(ds.sizes[TIME_NAME])
+        if len(times) == 0:
+            raise ValueError(f"No time steps to export for {dataset}")
+        grid = grid_for(dataset_dir, ds, LON_NAME, LAT_NAME)
+        slices = queue.Queue(maxsize=EXPORT_READ_AHEAD)
+        stop = threading.Event()
+        reader = threading.Thread(target=_read_slices,
+                                  args=(ds, var_name, lev, times, grid, slices, stop), daemon=True)
+
+        def frames():
+            while True:
+                frame = slices.get()
+                if frame is None:
+                    return
+                if isinstance(frame, Exception):
+                    raise frame
+                yield render_frame(frame, var_name, vmin, vmax, fmt="rgba")
+
+        reader.start()
+        try:
+            if fmt == "mp4":
+                _write_mp4(frames(), path, fps)
+            else:
+                _write_pil(frames(), path, fmt, fps)
+        finally:
+            # Unblock and wait for the reader even when drawing or encoding failed
+            stop.set()
+            while True:
+                try:
+                    slices.get_nowait()
+                except queue.Empty:
+                    break
+            reader.join()
+    return path
@@ -0,0 +1,114 @@
+# Rendering throughput benchmark
+#
+#    python benchmark.py <dataset> --var t2m --frames 16 --workers 1 4 8
+#
+# Renders the same set of frames with each worker count and reports frames/s,
+# so the gain from parallel rendering can be checked on a given node.
+#
+#    python benchmark.py <dataset> --var t2m --frames 16 --template
+#
+# Compares the per-frame cost of drawing a new figure for every frame with
+# reusing a cached figure template.
+#
+#    python benchmark.py <dataset> --var T --lev 3 --reads
+#
+# Reports the bytes a single frame read pulls from disk with xarray's default
+# per-file chunks and with the pool's one-slice chunks.
+
+import argparse
+import io
+import time
+
+import xarray as xr
+
+from datasetPool import DATASET_POOL, dataset_files
+from era5_plot import dataset_path, load_frame, read_frame, draw_frame, render_frame, STATS_INDEX, TIME_NAME
+from renderEngine import RenderEngine, RENDER_MODE
+
+
+def bench_throughput(dataset, var_name, frames, workers, mode=RENDER_MODE, lev=0):
+    path = dataset_path(dataset)
+    # Fixed colour limits, so no worker reads statistics or starts indexing the run
+    STATS_INDEX.refresh(path)
+    vmin, vmax = STATS_INDEX.limits(path, var_name, lev)
+    # Distinct steps only; later ones would be clipped to the last step and shared
+    with DATASET_POOL.acquire(path) as ds:
+        frames = min(frames, ds.sizes[TIME_NAME])
+    # No frame cache, so every frame is really rendered
+    engine = RenderEngine(workers=workers, mode=mode, cache=None)
+    # Warm-up with one distinct frame per worker, so dataset opening (and in
+    # process mode, each worker's imports) is not counted
+    engine.render_many([(dataset, 0, lev, var_name, vmin, vmax + i) for i in range(workers)])
+    start = time.perf_counter()
+    engine.render_many([(dataset, t, lev, var_name, vmin, vmax) for t in range(frames)])
+    elapsed = time.perf_counter() - start
+    engine.shutdown()
+    return frames / elapsed
+
+
+def bench_template(dataset, var_name, frames, lev=0):
+    # Slices are read up front so only drawing and PNG encoding are timed
+    slices = [read_frame(dataset, t, lev, var_name) for t in range(frames)]
+    vmin, vmax = STATS_INDEX.limits(dataset_path(dataset), var_name, lev)
+
+    start = time.perf_counter()
+    for frame in slices:
+        buf = io.BytesIO()
+        draw_frame(frame, vmin, vmax).savefig(buf, format="png", bbox_inches="tight")
+    full = (time.perf_counter() - start) / frames
+
+    # Warm-up builds the template
+    render_frame(slices[0], var_name, vmin, vmax)
+    start = time.perf_counter()
+    for frame in slices:
+        render_frame(frame, var_name, vmin, vmax)
+    template = (time.perf_counter() - start) / frames
+    return full, template
+
+
+def bench_reads(dataset, var_name, lev=0):
+    files = dataset_files(dataset_path(dataset))
+    results = {}
+    for label, chunks in (("default", None), ("slice", DATASET_POOL.chunks)):
+        with xr.open_mfdataset(files, engine="netcdf4", chunks=chunks) as ds:
+            start = time.perf_counter()
+            frame = load_frame(ds, var_name, 0, lev)
+            results[label] = (frame["bytes_read"], frame["arr"].nbytes, time.perf_counter() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame rendering throughput")
+    parser.add_argument("dataset")
+    parser.add_argument("--var", default="t2m")
+    parser.add_argument("--lev", type=int, default=0)
+    parser.add_argument("--frames", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--mode", default=RENDER_MODE, choices=["thread", "process"])
+    parser.add_argument("--template", action="store_true",
+                        help="compare full figure drawing with the cached figure template")
+    parser.add_argument("--reads", action="store_true",
+                        help="compare the chunk bytes a frame reads with default and one-slice chunks")
+    args = parser.parse_args()
+
+    if args.reads:
+        for label, (nbytes, slice_bytes, elapsed) in bench_reads(args.dataset, args.var, args.lev).items():
+            print(f"{label:8s} chunks  {nbytes / 2**20:9.2f} MiB read for a "
+                  f"{slice_bytes / 2**20:.2f} MiB slice  {elapsed * 1000:8.1f} ms")
+        return
+
+    if args.template:
+        full, template = bench_template(args.dataset, args.var, args.frames, args.lev)
+        print(f"new figure  {full * 1000:8.1f} ms/frame")
+        print(f"template    {template * 1000:8.1f} ms/frame  x{full / template:.2f}")
+        return
+
+    baseline = None
+    for workers in args.workers:
+        fps = bench_throughput(args.dataset, args.var, args.frames, workers, args.mode, args.lev)
+        baseline = baseline or fps
+        print(f"{args.mode:8s} workers={workers:3d}  {fps:7.2f} frames/s  x{fps / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
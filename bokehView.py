@@ -0,0 +1,126 @@
+from functools import lru_cache
+
+import numpy as np
+import panel as pn
+from bokeh.events import RangesUpdate, Tap
+from bokeh.models import ColorBar, ColumnDataSource, LinearColorMapper
+from bokeh.plotting import figure
+
+from tilePyramid import SlicePyramid
+
+# Fraction of the viewport span added on each side of the window sent to the
+# browser, so small pans do not need new data
+WINDOW_PAD = 0.25
+
+
+@lru_cache(maxsize=None)
+def coastline_lines():
+    """Natural Earth coastlines as Bokeh multi_line xs/ys, built once per process."""
+    try:
+        import cartopy.feature as cfeature
+        xs, ys = [], []
+        for geom in cfeature.COASTLINE.geometries():
+            lines = getattr(geom, "geoms", [geom])
+            for line in lines:
+                x, y = line.xy
+                xs.append(list(x))
+                ys.append(list(y))
+        return xs, ys
+    except Exception as e:
+        # skip coastlines if cartopy data isn't available
+        print(f"coastlines unavailable: {e}")
+        return [], []
+
+
+class BokehMapView:
+    """A 2D field as a Bokeh image glyph, colour-mapped in the browser.
+
+    The figure, coastlines and colour bar are sent once; show() only
+    replaces the float32 image array and the colour range. The array sent is
+    the part of a SlicePyramid under the viewport, at about one cell per
+    screen pixel, and is refreshed when the user zooms or pans outside it.
+    """
+
+    def __init__(self, width=900, height=450, palette="Viridis256"):
+        self.source = ColumnDataSource(data={
+            "image": [np.full((1, 1), np.nan, dtype="float32")],
+            "x": [-180.0], "y": [-90.0], "dw": [360.0], "dh": [180.0],
+        })
+        self.mapper = LinearColorMapper(palette=palette, nan_color="rgba(0, 0, 0, 0)")
+        self.figure = figure(
+            width=width, height=height,
+            x_range=(-180, 180), y_range=(-90, 90),
+            match_aspect=True,
+            tools="pan,wheel_zoom,box_zoom,reset,save",
+            active_scroll="wheel_zoom",
+        )
+        self.figure.image(image="image", x="x", y="y", dw="dw", dh="dh",
+                          source=self.source, color_mapper=self.mapper)
+        xs, ys = coastline_lines()
+        if xs:
+            self.figure.multi_line(xs, ys, line_color="black", line_width=0.7)
+        self.color_bar = ColorBar(color_mapper=self.mapper, orientation="horizontal")
+        self.figure.add_layout(self.color_bar, "below")
+        self.figure.xaxis.visible = False
+        self.figure.yaxis.visible = False
+        self.figure.grid.visible = False
+
+        # Probed point, drawn over the field
+        self.marker = ColumnDataSource(data={"x": [], "y": []})
+        self.figure.scatter("x", "y", source=self.marker, marker="x", size=12,
+                            line_color="firebrick", line_width=2)
+
+        self.figure.on_event(RangesUpdate, self._on_ranges)
+        self._viewport = (-180.0, 180.0, -90.0, 90.0)
+        self._pyramid = None
+        self._served = None
+
+        self.pane = pn.pane.Bokeh(self.figure, sizing_mode="scale_width", align="center")
+
+    def on_tap(self, callback):
+        """Call callback(lat, lon) when the map is clicked."""
+        self.figure.on_event(Tap, lambda event: callback(event.y, event.x))
+
+    def mark(self, lat, lon):
+        self.marker.data = {"x": [lon], "y": [lat]}
+
+    def update(self, frame: dict, vmin, vmax):
+        """Show a frame from era5_plot.load_frame."""
+        self.show(SlicePyramid(frame), vmin, vmax)
+
+    def show(self, pyramid: SlicePyramid, vmin, vmax):
+        """Show a slice pyramid, sending the window under the current viewport."""
+        self._pyramid = pyramid
+        self._served = None
+        self._send_window()
+        self.mapper.update(low=vmin, high=vmax)
+        self.figure.title.text = pyramid.title
+        self.color_bar.title = pyramid.units
+
+    def _on_ranges(self, event):
+        if None in (event.x0, event.x1, event.y0, event.y1):
+            return
+        self._viewport = (event.x0, event.x1, event.y0, event.y1)
+        self._send_window()
+
+    def _send_window(self):
+        if self._pyramid is None:
+            return
+        vx0, vx1, vy0, vy1 = self._viewport
+        padx, pady = (vx1 - vx0) * WINDOW_PAD, (vy1 - vy0) * WINDOW_PAD
+        scale = 1 + 2 * WINDOW_PAD
+        arr, (x0, x1, y0, y1), level = self._pyramid.window(
+            vx0 - padx, vx1 + padx, vy0 - pady, vy1 + pady,
+            max_nx=int(self.figure.width * scale), max_ny=int(self.figure.height * scale))
+
+        # Nothing to send while the viewport stays inside the window already shown
+        if self._served is not None:
+            served_level, (sx0, sx1, sy0, sy1) = self._served
+            if level == served_level and sx0 <= max(vx0, x0) and min(vx1, x1) <= sx1 \
+                    and sy0 <= max(vy0, y0) and min(vy1, y1) <= sy1:
+                return
+        self._served = (level, (x0, x1, y0, y1))
+        self.source.data = {
+            "image": [np.ascontiguousarray(arr, dtype="float32")],
+            "x": [x0], "y": [y0], "dw": [x1 - x0], "dh": [y1 - y0],
+        }
@@ -0,0 +1,275 @@
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from datasetPool import DATASET_POOL, cache_path, fingerprint_digest
+
+STATS_FILE = ".credit_stats.json"
+STATS_VERSION = 2
+
+
+def _summarize(arr, percentiles, axis=None):
+    """min/max/percentiles of an array, ignoring NaNs; per level when axis is given."""
+    with np.errstate(all="ignore"):
+        summary = {
+            "min": np.nanmin(arr, axis=axis),
+            "max": np.nanmax(arr, axis=axis),
+        }
+        for p in percentiles:
+            summary[f"p{p:g}"] = np.nanpercentile(arr, p, axis=axis)
+    return {k: np.asarray(v, dtype="float64").tolist() for k, v in summary.items()}
+
+
+class StatsIndex:
+    """Per-run colour range statistics, built once and kept in a file under CACHE_DIR.
+
+    Statistics are stored per NetCDF file, so when new forecast steps land only
+    those files are read. Lookups go through an in-memory aggregate that is
+    rebuilt only when the run's file fingerprint changes.
+
+    Aggregated percentiles are an envelope over the per-file values (lowest
+    low percentile, highest high percentile), not exact global percentiles.
+
+    Indexing a run reads all of its data, so build() does it in a background
+    thread. limits() never waits for that: until a run is fully indexed it
+    uses the files indexed so far, or with none yet, the one variable's
+    min/max read directly.
+    """
+
+    def __init__(self, level_dims=("level",), fill_threshold=1.0e20, percentiles=(1, 99),
+                 on_file=None):
+        self.level_dims = tuple(level_dims)
+        self.fill_threshold = fill_threshold
+        self.percentiles = tuple(percentiles)
+        # Called as on_file(dataset_dir, name, stamp, ds) while each file is open
+        # and loaded, so other per-file products come from the same read
+        self.on_file = on_file
+        self._aggregates = {}
+        # Per run: (fingerprint, aggregate of the files indexed so far) and direct min/max reads
+        self._partials = {}
+        self._direct = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._builder = None
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _file_stats(self, dataset_dir, name, stamp):
+        stats = {}
+        with xr.open_dataset(Path(dataset_dir) / name, engine="netcdf4") as ds:
+            for var_name, da in ds.data_vars.items():
+                if not np.issubdtype(da.dtype, np.number):
+                    continue
+                arr = da.values.astype("float32", copy=False)
+                arr = np.where(arr > self.fill_threshold, np.nan, arr)
+                entry = _summarize(arr, self.percentiles)
+                level_dim = next((d for d in self.level_dims if d in da.dims), None)
+                if level_dim is not None:
+                    # Move the level axis to the front and reduce over everything else
+                    per_level = np.moveaxis(arr, da.dims.index(level_dim), 0)
+                    per_level = per_level.reshape(per_level.shape[0], -1)
+                    entry["levels"] = _summarize(per_level, self.percentiles, axis=1)
+                stats[var_name] = entry
+            if self.on_file is not None:
+                # Variables read above stay in memory, so this reads nothing again
+                self.on_file(dataset_dir, name, stamp, ds)
+        return stats
+
+    def _load_sidecar(self, path):
+        try:
+            with open(path) as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if sidecar.get("version") != STATS_VERSION or \
+                sidecar.get("percentiles") != list(self.percentiles):
+            return {}
+        return sidecar.get("files", {})
+
+    def _save_sidecar(self, path, files):
+        sidecar = {"version": STATS_VERSION, "percentiles": list(self.percentiles), "files": files}
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(sidecar, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"stats: could not write {path}: {e}")
+
+    def _aggregate(self, files):
+        # Combine per-file statistics into one entry per variable
+        combined = {}
+        for stats in files.values():
+            for var_name, entry in stats["vars"].items():
+                combined.setdefault(var_name, []).append(entry)
+
+        def merge(entries):
+            merged = {}
+            for key in entries[0]:
+                if key == "levels":
+                    continue
+                values = np.array([e[key] for e in entries], dtype="float64")
+                reduce = np.nanmin if key == "min" or \
+                    (key.startswith("p") and float(key[1:]) < 50) else np.nanmax
+                with np.errstate(all="ignore"):
+                    merged[key] = reduce(values, axis=0).tolist()
+            return merged
+
+        aggregate = {}
+        for var_name, entries in combined.items():
+            aggregate[var_name] = merge(entries)
+            levels = [e["levels"] for e in entries if "levels" in e]
+            if levels:
+                aggregate[var_name]["levels"] = merge(levels)
+        return aggregate
+
+    def refresh(self, dataset_dir):
+        """Bring the statistics for a run up to date with its files and return the aggregate."""
+        key = str(Path(dataset_dir))
+        with self._key_lock(key):
+            fingerprint = DATASET_POOL.fingerprint(key)
+            cached = self._aggregates.get(key)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+
+            # Not next to the run: a write there changes the directory's mtime,
+            # which marks the newest run and drives the dataset watcher
+            path = cache_path(key, STATS_FILE)
+            files = self._load_sidecar(path)
+            current = {name: [mtime, size] for name, mtime, size in fingerprint}
+            changed = False
+            for name in list(files):
+                if name not in current:
+                    del files[name]
+                    changed = True
+            for name, stamp in current.items():
+                if name in files and files[name]["stamp"] == stamp:
+                    continue
+                print(f"stats: scanning {name}")
+                files[name] = {"stamp": stamp, "vars": self._file_stats(key, name, stamp)}
+                changed = True
+            if changed:
+                self._save_sidecar(path, files)
+
+            aggregate = self._aggregate(files)
+            with self._lock:
+                self._aggregates[key] = (fingerprint, aggregate)
+                self._partials.pop(key, None)
+                self._direct = {k: v for k, v in self._direct.items() if k[0] != key}
+            return aggregate
+
+    def build(self, dataset_dirs):
+        """Index runs in a background thread, one at a time, in the order given."""
+        with self._lock:
+            for dataset_dir in dataset_dirs:
+                key = str(Path(dataset_dir))
+                if key not in self._queued:
+                    self._queued.add(key)
+                    self._queue.put(key)
+            if self._builder is None:
+                self._builder = threading.Thread(target=self._build_loop, name="stats-index", daemon=True)
+                self._builder.start()
+
+    def _build_loop(self):
+        while True:
+            key = self._queue.get()
+            with self._lock:
+                self._queued.discard(key)
+            try:
+                self.refresh(key)
+            except Exception as e:
+                print(f"stats: could not index {key}: {e}")
+
+    def _lookup(self, key):
+        """(aggregate, complete) without reading any data; aggregate is None when nothing is indexed."""
+        fingerprint = DATASET_POOL.fingerprint(key)
+        with self._lock:
+            cached = self._aggregates.get(key)
+            partial = self._partials.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1], True
+        if cached is not None:
+            # Files landed since: the earlier steps' statistics until they are indexed
+            return cached[1], False
+        if partial is None or partial[0] != fingerprint:
+            current = {name: [mtime, size] for name, mtime, size in fingerprint}
+            files = {name: f for name, f in self._load_sidecar(cache_path(key, STATS_FILE)).items()
+                     if current.get(name) == f["stamp"]}
+            partial = (fingerprint, self._aggregate(files) if files else None)
+            if files and len(files) == len(current):
+                # Indexed by an earlier process: nothing left to build
+                with self._lock:
+                    self._aggregates[key] = partial
+                return partial[1], True
+            with self._lock:
+                self._partials[key] = partial
+        return partial[1], False
+
+    def _direct_limits(self, key, var_name, lev):
+        # One variable's (one level's) min/max straight from the data, as before the index
+        fingerprint = DATASET_POOL.fingerprint(key)
+        direct_key = (key, fingerprint_digest(fingerprint), var_name, lev)
+        with self._lock:
+            limits = self._direct.get(direct_key)
+        if limits is not None:
+            return limits
+        with DATASET_POOL.acquire(key) as ds:
+            if var_name not in ds.data_vars:
+                raise ValueError(f"No statistics for variable '{var_name}' in {key}")
+            da = ds[var_name]
+            level_dim = next((d for d in self.level_dims if d in da.dims), None)
+            if lev is not None and level_dim is not None:
+                da = da.isel({level_dim: lev})
+            da = da.where(da <= self.fill_threshold)
+            limits = (float(da.min().values), float(da.max().values))
+        with self._lock:
+            # Not kept once the index has caught up meanwhile; refresh() only clears earlier ones
+            indexed = self._aggregates.get(key)
+            if indexed is None or indexed[0] != fingerprint:
+                self._direct[direct_key] = limits
+        return limits
+
+    def indexed(self, dataset_dir) -> bool:
+        """True when the statistics cover all of a run's current files."""
+        return self._lookup(str(Path(dataset_dir)))[1]
+
+    def limits(self, dataset_dir, var_name, lev=None, percentile=False):
+        """(vmin, vmax) for a variable, for one level index when lev is given.
+
+        With percentile=True the lowest and highest stored percentiles are
+        returned instead of the absolute min/max. A run that is not fully
+        indexed is queued for build() and answered from what is there.
+        """
+        key = str(Path(dataset_dir))
+        aggregate, complete = self._lookup(key)
+        if not complete:
+            self.build([key])
+        entry = None if aggregate is None else aggregate.get(var_name)
+        if entry is None:
+            if complete:
+                raise ValueError(f"No statistics for variable '{var_name}' in {dataset_dir}")
+            return self._direct_limits(key, var_name, lev)
+        if lev is not None and "levels" in entry:
+            entry = entry["levels"]
+        lo, hi = ("min", "max")
+        if percentile:
+            lo, hi = f"p{min(self.percentiles):g}", f"p{max(self.percentiles):g}"
+        vmin, vmax = entry[lo], entry[hi]
+        if isinstance(vmin, list):
+            vmin, vmax = vmin[lev], vmax[lev]
+        return vmin, vmax
+
+    def shared_limits(self, dataset_dirs, var_name, lev=None, percentile=False):
+        """One (vmin, vmax) covering a variable in several runs, for a common colour scale."""
+        limits = [self.limits(d, var_name, lev, percentile) for d in dataset_dirs]
+        return min(lo for lo, _ in limits), max(hi for _, hi in limits)
@@ -1,13 +1,25 @@
+import os
 import panel as pn
 import param
-import subprocess
+import pandas as pd
 from pathlib import Path
 from datetime import datetime, timedelta
 from directorySelect import DirectorySelect
 from tkinter import Tk, filedialog
 from directoryPicker import RemoteDirPicker
+from jobQueue import JOB_QUEUE
+from logView import LogView
+
+# Milliseconds between console refreshes while a job is running
+CONSOLE_REFRESH_MS = int(os.environ.get("CONSOLE_REFRESH_MS", 500))
 
 class CommandRunner(param.Parameterized):
+    """Inference tab: launches commands on the shared JOB_QUEUE without blocking the server.
+
+    Each run is a job with its own status and exit code; the console shows
+    the selected job's output as it is written, appending the lines that
+    arrived every CONSOLE_REFRESH_MS while something is running.
+    """
     command_input = param.String(default="")
     output_log = param.String(default="Terminal ready...")
     startDate = param.Date(default=datetime.now().replace(minute=0, second=0, microsecond=0))
@@ -43,12 +55,11 @@ class CommandRunner(param.Parameterized):
         # 1. Text Input
         self.editor = pn.widgets.TextInput(
             name="Command input",
-            placeholder="Type and press Enter...",
+            placeholder="Type a command and press Run...",
             sizing_mode='stretch_width',
             value=self.command_input
         )
         self.editor.link(self, value='command_input')
-        self.editor.param.watch(self._execute, 'value')
         
         # 2. Button - Added 'visible=True' and explicit height to prevent 0px rendering
         self.run_btn = pn.widgets.Button(
@@ -59,14 +70,32 @@ class CommandRunner(param.Parameterized):
             visible=True,
             sizing_mode='fixed'
         )
+        # The only trigger: each submit queues a job that writes the run's output
         self.run_btn.on_click(self._execute)
         
         # 3. Output area
-        self.console = pn.widgets.StaticText(
-            name="Output log",
-            value=f"<pre style='background:#f4f4f4; padding:5px;'>{self.output_log}</pre>",
+        self.console = LogView()
+        self.console.terminal.write(self.output_log + "\n")
+
+        # 4. Jobs; selecting a row shows that job in the console
+        self.jobs_table = pn.widgets.Tabulator(
+            self._jobs_frame(),
+            show_index=False,
+            selectable=1,
+            disabled=True,
+            height=160,
             sizing_mode='stretch_width'
         )
+        self.jobs_table.param.watch(self._on_job_selected, 'selection')
+        self.cancel_btn = pn.widgets.Button(name="Cancel Job", button_type="danger", height=40, min_width=120)
+        self.cancel_btn.on_click(self._cancel)
+
+        self._job = None
+        self._refresh_cb = None
+        self._doc = pn.state.curdoc
+        JOB_QUEUE.subscribe(self._on_job_event)
+        if self._doc is not None and self._doc.session_context is not None:
+            pn.state.on_session_destroyed(lambda session_context: self._stop())
 
     def _select_files(*b):
         picker = RemoteDirPicker()
@@ -112,16 +141,58 @@ class CommandRunner(param.Parameterized):
         cmd = self.editor.value.strip()
         if not cmd: return
 
-        try:
-            startDateStr = self.startDate.strftime('%Y-%m-%d')
-            endDateStr = self.endDate.strftime('%Y-%m-%d')
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-            response = result.stdout if result.returncode == 0 else result.stderr
-            self.output_log = response + " " + startDate + " " + endDate if response else "Done."
-        except Exception as e:
-            self.output_log = str(e)
-            
-        self.console.value = f"<pre style='background:#f4f4f4; padding:5px;'>{self.output_log}</pre>"
+        # The chosen date range reaches the command through its environment
+        env = {
+            "START_DATE": self.startDate.strftime('%Y-%m-%d'),
+            "END_DATE": self.endDate.strftime('%Y-%m-%d'),
+        }
+        self._show_job(JOB_QUEUE.submit(cmd, env=env))
+
+    def _cancel(self, event):
+        if self._job is not None:
+            JOB_QUEUE.cancel(self._job.id)
+
+    def _jobs_frame(self):
+        rows = [job.summary() for job in reversed(JOB_QUEUE.all_jobs())]
+        return pd.DataFrame(rows, columns=["id", "status", "exit", "runtime", "command"])
+
+    def _on_job_selected(self, event):
+        if event.new:
+            job_id = int(self.jobs_table.value.iloc[event.new[0]]["id"])
+            self._show_job(JOB_QUEUE.jobs.get(job_id))
+
+    def _show_job(self, job):
+        self._job = job
+        self.console.show(job)
+        self._refresh()
+
+    def _on_job_event(self, job):
+        # Called from a job thread; widget updates go through this session's event loop
+        if self._doc is not None and self._doc.session_context is not None:
+            self._doc.add_next_tick_callback(self._refresh)
+        elif self._doc is None:
+            self._refresh()
+
+    def _refresh(self):
+        self.jobs_table.value = self._jobs_frame()
+        self._update_console()
+        # Poll output only while something is running
+        running = bool(JOB_QUEUE.active())
+        if running and self._refresh_cb is None:
+            self._refresh_cb = pn.state.add_periodic_callback(self._update_console, period=CONSOLE_REFRESH_MS)
+        elif not running and self._refresh_cb is not None:
+            self._refresh_cb.stop()
+            self._refresh_cb = None
+
+    def _update_console(self):
+        if self._job is not None:
+            self.console.update()
+
+    def _stop(self):
+        JOB_QUEUE.unsubscribe(self._on_job_event)
+        if self._refresh_cb is not None:
+            self._refresh_cb.stop()
+            self._refresh_cb = None
 
     def panel(self):
         return pn.Column(
@@ -130,8 +201,9 @@ class CommandRunner(param.Parameterized):
             pn.Row(self.startDatePicker, self.endDatePicker),
             "### CommandRunner",
             self.editor,
-            self.run_btn, # Explicitly included in the column
-            self.console,
+            pn.Row(self.run_btn, self.cancel_btn), # Explicitly included in the column
+            self.jobs_table,
+            self.console.panel(),
             sizing_mode='stretch_width',
             min_height=300 # Forces the container to expand
         )
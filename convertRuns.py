@@ -0,0 +1,109 @@
+# Convert forecast runs to a single consolidated store
+#
+#    python convertRuns.py [run ...] [--references] [--force]
+#
+# Writes run.zarr (a chunked, consolidated Zarr copy of the run) or, with
+# --references, run.references.json (a Kerchunk index pointing into the
+# existing NetCDF files) next to each run, or under the cache directory when
+# the run is read-only. Runs are named relative to MAP_DATA_DIR, or given as
+# paths; with no arguments every run there is converted.
+#
+# The pool and the metadata scan use a store only while it matches the
+# run's current NetCDF files, so a run that is still being written falls back
+# to reading *.nc until it is converted again.
+
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+
+import xarray as xr
+
+from datasetPool import (DATASET_POOL, FINGERPRINT_ATTR, REFERENCE_INDEX, ZARR_STORE,
+                         dataset_files, dataset_fingerprint, open_run_store, sidecar_path)
+from era5_plot import data_dir, TIME_NAME, LEV_NAME, PRES_NAME, LAT_NAME, LON_NAME
+
+# NetCDF encodings that carry over to Zarr; the rest (on-disk chunking, zlib) do not apply
+KEEP_ENCODING = ("units", "calendar", "dtype", "_FillValue", "scale_factor", "add_offset")
+
+
+def convert_zarr(path) -> Path:
+    fingerprint = dataset_fingerprint(path)
+    files = [str(Path(path) / name) for name, _, _ in fingerprint]
+    out = sidecar_path(path, ZARR_STORE)
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    # Chunked like the pool reads: one (time, level) slice per chunk
+    with xr.open_mfdataset(files, engine="netcdf4", chunks=DATASET_POOL.chunks) as ds:
+        for v in ds.variables.values():
+            v.encoding = {k: val for k, val in v.encoding.items() if k in KEEP_ENCODING}
+        ds.attrs[FINGERPRINT_ATTR] = [list(f) for f in fingerprint]
+        ds.to_zarr(tmp, mode="w", consolidated=True)
+
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return out
+
+
+def convert_references(path) -> Path:
+    # Optional dependency, only needed for reference indexes
+    from kerchunk.combine import MultiZarrToZarr
+    from kerchunk.hdf import SingleHdf5ToZarr
+
+    fingerprint = dataset_fingerprint(path)
+    files = [str(Path(path) / name) for name, _, _ in fingerprint]
+    singles = [SingleHdf5ToZarr(f, inline_threshold=300).translate() for f in files]
+    # Coordinates shared by every file rather than concatenated along time
+    dims = [d for d in (LAT_NAME, LON_NAME, LEV_NAME, PRES_NAME) if f"{d}/.zarray" in singles[0]["refs"]]
+    # Decode time through its CF units, which usually differ from file to file
+    refs = MultiZarrToZarr(singles, concat_dims=[TIME_NAME], identical_dims=dims,
+                           coo_map={TIME_NAME: f"cf:{TIME_NAME}"}).translate()
+
+    attrs = json.loads(refs["refs"].get(".zattrs", "{}"))
+    attrs[FINGERPRINT_ATTR] = [list(f) for f in fingerprint]
+    refs["refs"][".zattrs"] = json.dumps(attrs)
+
+    out = sidecar_path(path, REFERENCE_INDEX)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(refs, f)
+    os.replace(tmp, out)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert forecast runs to Zarr or a Kerchunk index")
+    parser.add_argument("runs", nargs="*", help="run names under MAP_DATA_DIR or run directories")
+    parser.add_argument("--references", action="store_true",
+                        help="write a Kerchunk reference index instead of a Zarr copy")
+    parser.add_argument("--force", action="store_true", help="convert runs whose store is up to date")
+    args = parser.parse_args()
+
+    if args.runs:
+        paths = [Path(r) if Path(r).is_dir() else Path(data_dir) / r for r in args.runs]
+    else:
+        paths = sorted(d for d in Path(data_dir).iterdir() if d.is_dir())
+
+    for path in paths:
+        if not dataset_files(path):
+            print(f"convert: no NetCDF files in {path}, skipping")
+            continue
+        if not args.force:
+            ds = open_run_store(path, dataset_fingerprint(path))
+            if ds is not None:
+                ds.close()
+                print(f"convert: {path} is up to date")
+                continue
+        # Keep the run's mtime, which marks the newest run and drives the dataset watcher
+        st = path.stat()
+        out = convert_references(path) if args.references else convert_zarr(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        print(f"convert: {path} -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,30 @@
 # Step 1: Load datasets dynamically
+import asyncio
+import io
+import os
+import tempfile
+from functools import partial
 import xarray as xr
 from pathlib import Path
-from era5_plot import plot_png, NETCDF_FILE, VAR_NAME, TIME_NAME, LEV_NAME, PRES_NAME, LAT_NAME, LON_NAME
+from era5_plot import preview_png, dataset_path, STATS_INDEX, NETCDF_FILE, VAR_NAME, TIME_NAME, LEV_NAME, PRES_NAME, LAT_NAME, LON_NAME
+from renderEngine import RENDER_ENGINE, Prefetcher, PREFETCH_DEPTH, PREFETCH_MB, clip_time
+from animationExport import export_animation, EXPORT_DIR, EXPORT_FORMATS
+from bokehView import BokehMapView
+from tilePyramid import SlicePyramid, get_pyramid
+from derivedFields import DERIVED_KINDS, derived_frame, derived_limits
+from pointProbe import probe_series, probe_profile
+from probeView import ProbeView
 import panel as pn
 import param
 
 pn.extension(raw_css=[Path("static/styles.css").read_text()])
 
+# Frames kept rendering ahead of the playhead during playback
+PLAYBACK_BUFFER = 8
+# Window (ms) in which widget changes are batched into one render; while a
+# slider is dragged this is also the interval between preview renders
+DEBOUNCE_MS = int(os.environ.get("DEBOUNCE_MS", 150))
+
 class DatasetPlot2(param.Parameterized):
     dataset = param.String()
     dimension = param.String()
@@ -14,9 +32,56 @@ class DatasetPlot2(param.Parameterized):
     time_index = param.Integer()
     level_index = param.Integer()
     metadata = param.Dict(default={})
+    # Frames rendered ahead of (and one behind) the time slider
+    prefetch_depth = param.Integer(default=PREFETCH_DEPTH, bounds=(0, None))
+    prefetch_mb = param.Number(default=PREFETCH_MB, bounds=(0, None))
+    playing = param.Boolean(default=False)
+    fps = param.Integer(default=4, bounds=(1, 30))
+    # "png": server-rendered Matplotlib/Cartopy image, "bokeh": raw field colour-mapped in the browser
+    backend = param.Selector(default="png", objects=["png", "bokeh"])
+    debounce_ms = param.Integer(default=DEBOUNCE_MS, bounds=(0, None))
+    # (vmin, vmax) overriding the run's own colour range, e.g. shared by linked plots
+    color_limits = param.Tuple(default=None, length=2, allow_None=True)
+    # "field" shows this run; the others are derived from ensemble/reference (see derivedFields)
+    view_type = param.Selector(default="field", objects=["field"] + DERIVED_KINDS)
+    reference = param.String(default="", allow_None=True)
+    # Datasets shown alongside this one, set by the plot grid
+    ensemble = param.List(default=[])
+    # Point whose time series / vertical profile is shown next to the map
+    probe_lat = param.Number(default=None, bounds=(-90, 90), allow_None=True)
+    probe_lon = param.Number(default=None, allow_None=True)
 
     def __init__(self, **params):
         super().__init__(**params)
+        self._prefetcher = Prefetcher(depth=self.prefetch_depth,
+                                      budget_bytes=int(self.prefetch_mb * 2**20))
+        self._player = Prefetcher(depth=PLAYBACK_BUFFER, budget_bytes=int(self.prefetch_mb * 2**20))
+        self._playback = None
+        self._bokeh_view = None
+        self._plot_area = pn.Column(sizing_mode="stretch_width", align="center", margin=0)
+        self._png_pane = pn.pane.PNG(
+            None,
+            sizing_mode="scale_width",
+            align="center",
+            height=None,
+            min_height=None,
+            max_height=None
+        )
+        # At most one PNG render per plot runs at a time; requests arriving
+        # meanwhile only mark it stale, so a drag ends in one render for the
+        # final slider position
+        self._rendering = False
+        self._stale = False
+        # Set while a playback tick resolves its frame
+        self._advancing = False
+        # Set while an animation export runs; the last exported file
+        self._exporting = False
+        self._export_path = None
+        # Pending batched render and the last (backend, t, lev, var) sent to a render
+        self._doc = pn.state.curdoc
+        self._timer = None
+        self._last_request = None
+        self._paused = False
 
         #self.dsMeta = DATASET_METADATA[self.dataset]
         #self.metadata = 
@@ -73,6 +138,8 @@ class DatasetPlot2(param.Parameterized):
             sizing_mode="stretch_width"
         )
         self.time_slider.link(self, value="time_index")
+        # Mouse release: render the final position without waiting for the window
+        self.time_slider.param.watch(lambda event: self._schedule_render(final=True), "value_throttled")
 
         self.level_slider = pn.widgets.IntSlider(
             name="",
@@ -84,6 +151,7 @@ class DatasetPlot2(param.Parameterized):
             sizing_mode="stretch_width"
         )
         self.level_slider.link(self, value="level_index")
+        self.level_slider.param.watch(lambda event: self._schedule_render(final=True), "value_throttled")
 
         time_display = pn.pane.HTML(
             pn.bind(lambda v: f"<b>Time:</b> {v}", self.time_slider.param.value),
@@ -108,6 +176,81 @@ class DatasetPlot2(param.Parameterized):
             max_width=800, # SET THIS to match your Plot width
             css_classes=["widget-row"]
         )
+
+        # Playback and export controls
+        self.play_button = pn.widgets.Toggle(name="\u25B6 Play", value=False, width=90, align="center")
+        self.play_button.link(self, value="playing")
+        self.fps_input = pn.widgets.IntInput(name="", value=self.fps, start=1, end=30,
+                                             width=70, align="center")
+        self.fps_input.link(self, value="fps")
+        self.export_format = pn.widgets.Select(name="", options=EXPORT_FORMATS, value="gif",
+                                               width=80, align="center")
+        self.export_button = pn.widgets.Button(name="Export", width=100, align="center")
+        self.export_button.on_click(lambda event: pn.state.execute(self._export))
+        # Offers the last finished export; hidden until there is one
+        self.export_download = pn.widgets.FileDownload(
+            label="Download",
+            button_type="default",
+            visible=False,
+            width=100,
+            align="center"
+        )
+        if self._doc is not None and self._doc.session_context is not None:
+            pn.state.on_session_destroyed(lambda session_context: self._drop_export())
+        self.backend_selector = pn.widgets.Select(name="", options=["png", "bokeh"], value=self.backend,
+                                                  width=80, align="center")
+        self.backend_selector.link(self, value="backend")
+
+        # Derived views against other selected runs
+        self.view_selector = pn.widgets.Select(name="", options=["field"] + DERIVED_KINDS,
+                                               value=self.view_type, width=110, align="center")
+        self.view_selector.link(self, value="view_type")
+        self.reference_selector = pn.widgets.Select(name="", options=self._reference_options(),
+                                                    width=160, align="center")
+        self.reference_selector.link(self, value="reference")
+        self.derived_row = pn.Row(
+            pn.widgets.StaticText(value="<b>View</b>", width=40, align="center"),
+            self.view_selector,
+            pn.widgets.StaticText(value="<b>Reference</b>", width=75, align="center"),
+            self.reference_selector,
+            align="center",
+            sizing_mode="stretch_width",
+            max_width=800, # SET THIS to match your Plot width
+            css_classes=["widget-row"]
+        )
+
+        # Point probe: typed coordinates, or a click on the bokeh map
+        self._probe_view = ProbeView()
+        self.probe_lat_input = pn.widgets.FloatInput(name="", placeholder="lat", start=-90, end=90,
+                                                     width=80, align="center")
+        self.probe_lon_input = pn.widgets.FloatInput(name="", placeholder="lon", width=80, align="center")
+        self.probe_button = pn.widgets.Button(name="Probe", width=70, align="center")
+        self.probe_button.on_click(lambda event: self._probe_at(self.probe_lat_input.value,
+                                                                self.probe_lon_input.value))
+        self.probe_row = pn.Row(
+            pn.widgets.StaticText(value="<b>Point</b>", width=40, align="center"),
+            self.probe_lat_input,
+            self.probe_lon_input,
+            self.probe_button,
+            align="center",
+            sizing_mode="stretch_width",
+            max_width=800, # SET THIS to match your Plot width
+            css_classes=["widget-row"]
+        )
+
+        self.play_row = pn.Row(
+            self.play_button,
+            pn.widgets.StaticText(value="<b>FPS</b>", width=35, align="center"),
+            self.fps_input,
+            self.export_format,
+            self.export_button,
+            self.export_download,
+            self.backend_selector,
+            align="center",
+            sizing_mode="stretch_width",
+            max_width=800, # SET THIS to match your Plot width
+            css_classes=["widget-row"]
+        )
         
     @param.depends('dimension', watch=True)
     def _update_variable_options(self):
@@ -127,34 +270,384 @@ class DatasetPlot2(param.Parameterized):
         if new_options:
             self.var_selector.value = new_options[0]
 
-    @pn.depends("time_index", "level_index", "var_name")
-    def view(self):
-        buf = plot_png(
-            dataset=self.dataset,
-            t=self.time_index,
-            lev=self.level_index,
-            var_name=self.var_name
-        )
+    @param.depends('prefetch_depth', 'prefetch_mb', watch=True)
+    def _update_prefetcher(self):
+        self._prefetcher.depth = self.prefetch_depth
+        self._prefetcher.budget_bytes = int(self.prefetch_mb * 2**20)
 
-        return pn.pane.PNG(
-            buf,
-            #sizing_mode="stretch_width",
-            sizing_mode="scale_width",
-            align="center",
-            height=None,
-            min_height=None,
-            max_height=None
-            #max_width=800,
-            #height=450
-            #css_classes=["plot-panel"]
-        )
+    def _level(self):
+        # The level only matters for 3D variables; keep 2D frames under one cache key
+        return self.level_index if self.var_name in self.metadata["vars3d"] else 0
+
+    def _reference_options(self):
+        return [d for d in self.ensemble if d != self.dataset]
+
+    @param.depends('ensemble', watch=True)
+    def _update_reference_options(self):
+        options = self._reference_options()
+        self.reference_selector.options = options
+        if self.reference_selector.value not in options:
+            self.reference_selector.value = options[0] if options else None
+
+    def _derived(self):
+        """(kind, members, reference) for derivedFields, or None to show the field itself."""
+        reference = self.reference if self.reference in self._reference_options() else ""
+        if self.view_type == "difference" and reference:
+            return ("difference", (self.dataset,), reference)
+        if self.view_type in ("mean", "std"):
+            return (self.view_type, tuple(self.ensemble or [self.dataset]), "")
+        if self.view_type == "rmse" and reference:
+            return ("rmse", tuple(d for d in self.ensemble if d != reference), reference)
+        return None
+
+    def _view_state(self):
+        return (self.time_index, self._level(), self.var_name, self.color_limits, self._derived())
+
+    def _field_limits(self):
+        """(vmin, vmax) of the current variable itself, whatever view is shown."""
+        if self.color_limits is not None:
+            return self.color_limits
+        return STATS_INDEX.limits(dataset_path(self.dataset), self.var_name, self._level())
+
+    def _frame_params(self):
+        """(lev, vmin, vmax) for rendering the current variable."""
+        derived = self._derived()
+        if derived is not None:
+            vmin, vmax = derived_limits(*derived, self.var_name, self._level())
+        else:
+            vmin, vmax = self._field_limits()
+        return self._level(), vmin, vmax
+
+    @param.depends('playing', watch=True)
+    def _toggle_playback(self):
+        if self.playing:
+            self.play_button.name = "\u23F8 Pause"
+            self._playback = pn.state.add_periodic_callback(self._advance, period=int(1000 / self.fps))
+        else:
+            self.play_button.name = "\u25B6 Play"
+            if self._playback is not None:
+                self._playback.stop()
+                self._playback = None
+            self._player.cancel()
+
+    @param.depends('fps', watch=True)
+    def _update_fps(self):
+        if self._playback is not None:
+            self._playback.period = int(1000 / self.fps)
+
+    async def _advance(self):
+        # Called on every playback tick: step forward only once the next frame
+        # is ready, so the event loop never waits on a render. Colour limits
+        # (derived ones read data the first time) are resolved in a worker.
+        if self._advancing:
+            return
+        self._advancing = True
+        try:
+            loop = asyncio.get_running_loop()
+            ntime = self.metadata["ntime"]
+            t, var_name, derived = self.time_index, self.var_name, self._derived()
+            future = await loop.run_in_executor(None, self._buffer_playback, t, var_name, derived, ntime)
+            if not self.playing or (t, var_name, derived) != (self.time_index, self.var_name, self._derived()):
+                return
+            if future.done():
+                self.time_slider.value = (t + 1) % ntime
+                self._schedule_render(final=True)
+        except Exception as e:
+            print(f"playback failed for {self.dataset} {self.var_name} t={self.time_index}: {e}")
+        finally:
+            self._advancing = False
+
+    def _buffer_playback(self, t, var_name, derived, ntime):
+        # Worker thread: colour limits, frame keys (which stat the run's files)
+        # and cache lookups; returns the future of the next frame
+        lev, vmin, vmax = self._frame_params()
+        self._player.schedule(self.dataset, t, lev, var_name,
+                              ntime=ntime, vmin=vmin, vmax=vmax, derived=derived)
+        return RENDER_ENGINE.submit(self.dataset, (t + 1) % ntime, lev, var_name,
+                                    vmin, vmax, background=True, derived=derived)
+
+    def _submit_frame(self, t, var_name, derived):
+        # Worker thread: colour limits, the frame key and the cache lookup,
+        # which may read a spilled frame back from disk
+        lev, vmin, vmax = self._frame_params()
+        future = RENDER_ENGINE.submit(self.dataset, t, lev, var_name, vmin, vmax, derived=derived)
+        return lev, vmin, vmax, future
+
+    def _preview_png(self, t, lev, var_name, vmin, vmax):
+        # Worker thread: a coarse copy of this slice from an earlier read or
+        # the statistics pass, if any
+        return preview_png(self.dataset, clip_time(self.dataset, t), lev, var_name, vmin, vmax)
+
+    def _drop_export(self):
+        if self._export_path is not None:
+            self._export_path.unlink(missing_ok=True)
+            self._export_path = None
+
+    async def _export(self):
+        # The export reads, draws and encodes every time step, so it runs in
+        # a worker; the finished file is then offered for download
+        if self._exporting:
+            return
+        self._exporting = True
+        self.export_button.disabled = True
+        self.export_button.name = "Exporting\u2026"
+        dataset, var_name, fmt, fps = self.dataset, self.var_name, self.export_format.value, self.fps
+        path = None
+        loop = asyncio.get_running_loop()
+        try:
+            # The export draws the field itself, so a derived view's range does not apply
+            lev = self._level()
+            vmin, vmax = await loop.run_in_executor(None, self._field_limits)
+            EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+            fd, name = tempfile.mkstemp(suffix="." + fmt, dir=EXPORT_DIR)
+            os.close(fd)
+            path = Path(name)
+            await loop.run_in_executor(None, lambda: export_animation(
+                dataset, var_name, path, lev=lev, fmt=fmt, fps=fps, vmin=vmin, vmax=vmax))
+        except Exception as e:
+            print(f"export failed for {dataset} {var_name}: {e}")
+            if path is not None:
+                path.unlink(missing_ok=True)
+            return
+        finally:
+            self._exporting = False
+            self.export_button.disabled = False
+            self.export_button.name = "Export"
+        self._drop_export()
+        self._export_path = path
+        self.export_download.filename = f"{dataset}_{var_name}.{fmt}"
+        self.export_download.file = str(path)
+        self.export_download.visible = True
+
+    @param.depends('backend', watch=True)
+    def _switch_backend(self):
+        if self.backend == "bokeh":
+            if self._bokeh_view is None:
+                self._bokeh_view = BokehMapView()
+                self._bokeh_view.on_tap(self._probe_at)
+                if self.probe_lat is not None:
+                    self._bokeh_view.mark(self.probe_lat, self.probe_lon)
+            self._plot_area[:] = [self._bokeh_view.pane]
+        else:
+            self._plot_area[:] = [self._png_pane]
+        self._flush(force=True)
+
+    @param.depends("time_index", "level_index", "var_name", "color_limits",
+                   "view_type", "reference", "ensemble", watch=True)
+    def _on_view_change(self):
+        self._schedule_render()
+
+    def _schedule_render(self, final=False):
+        """Batch view changes into one render per debounce window.
+
+        The first change opens the window and the render at its end uses
+        whatever the state is by then, so a dimension switch (which also
+        changes the variable) or a slider drag costs one render per window.
+        final=True renders right away, e.g. when a slider is released.
+        """
+        if self._paused:
+            # Picked up by resume()
+            return
+        if self._doc is None or self._doc.session_context is None:
+            self._flush()
+            return
+        # Watchers may run in Panel's worker threads (nthreads), and Bokeh only
+        # takes next-tick callbacks from those; the window is kept on the loop
+        self._doc.add_next_tick_callback(partial(self._schedule_on_loop, final))
+
+    def _schedule_on_loop(self, final):
+        if self._paused:
+            return
+        if final:
+            self._cancel_timer()
+            self._flush()
+            return
+        if self._timer is not None:
+            return
+        if self.debounce_ms == 0:
+            self._flush()
+            return
+        self._timer = self._doc.add_timeout_callback(self._flush, self.debounce_ms)
+
+    def _cancel_timer(self):
+        # Event loop only
+        if self._timer is not None:
+            self._doc.remove_timeout_callback(self._timer)
+            self._timer = None
+
+    def _flush(self, force=False):
+        self._timer = None
+        if self._paused:
+            return
+        request = (self.backend,) + self._view_state()
+        if request == self._last_request and not force:
+            return
+        self._last_request = request
+        if self.probe_lat is not None:
+            pn.state.execute(self._update_probe)
+        if self.backend == "bokeh":
+            pn.state.execute(self._update_bokeh)
+        else:
+            pn.state.execute(self._render_png)
+
+    def set_view(self, var_name, t, lev, color_limits=None, final=False):
+        """Drive the plot's controls from outside, e.g. from a linked comparison."""
+        self.dim_selector.value = "3D" if var_name in self.metadata["vars3d"] else "2D"
+        self.var_selector.value = var_name
+        self.time_slider.value = min(t, self.time_slider.end)
+        self.level_slider.value = min(lev, self.level_slider.end)
+        self.color_limits = color_limits
+        self._schedule_render(final=final)
+
+    def refresh_metadata(self, metadata):
+        """Take a newer metadata entry for the run, e.g. after forecast steps landed.
+
+        Only the slider ranges change; a plot showing the last step follows
+        the run forward.
+        """
+        if metadata is self.metadata:
+            return
+        following = self.time_slider.value >= self.time_slider.end - 1
+        self.metadata = metadata
+        self.time_slider.end = metadata["ntime"]
+        self.level_slider.end = metadata["nlev"]
+        if following and self.time_slider.value < metadata["ntime"] - 1:
+            self.time_slider.value = metadata["ntime"] - 1
+            self._schedule_render(final=True)
+        elif self.probe_lat is not None:
+            # The time series now reaches further
+            pn.state.execute(self._update_probe)
+
+    def _probe_at(self, lat, lon):
+        if lat is None or lon is None:
+            return
+        self.probe_lat_input.value, self.probe_lon_input.value = lat, lon
+        self.param.update(probe_lat=max(-90.0, min(90.0, lat)), probe_lon=lon)
+
+    @param.depends("probe_lat", "probe_lon", watch=True)
+    def _on_probe_change(self):
+        if self._bokeh_view is not None and self.probe_lat is not None:
+            self._bokeh_view.mark(self.probe_lat, self.probe_lon)
+        pn.state.execute(self._update_probe)
+
+    async def _update_probe(self):
+        # The series only changes with the point, variable or level (and is
+        # cached); the profile is one short column read per time step
+        if self.probe_lat is None or self.probe_lon is None:
+            return
+        loop = asyncio.get_running_loop()
+        lat, lon, t, var_name, lev = (self.probe_lat, self.probe_lon, self.time_index,
+                                      self.var_name, self._level())
+        try:
+            series = await loop.run_in_executor(None, probe_series, self.dataset, var_name, lat, lon, lev)
+            profile = None
+            if var_name in self.metadata["vars3d"]:
+                profile = await loop.run_in_executor(None, probe_profile, self.dataset, var_name,
+                                                     lat, lon, t)
+        except Exception as e:
+            print(f"probe failed for {self.dataset} {var_name} at {lat}, {lon}: {e}")
+            return
+        self._probe_view.update(var_name, series, profile, t)
+
+    def pause(self):
+        """Stop playback, prefetching and rendering while the plot is not shown."""
+        self._paused = True
+        self.playing = False
+        if self._doc is not None and self._doc.session_context is not None:
+            self._doc.add_next_tick_callback(self._cancel_timer)
+        self._prefetcher.cancel()
+
+    def resume(self):
+        """Show the plot again, rendering only if its state changed while paused."""
+        if self._paused:
+            self._paused = False
+            self._flush()
+
+    def _bokeh_frame(self, t, var_name, derived):
+        # Worker thread: the data read, pyramid build and colour limits
+        lev, vmin, vmax = self._frame_params()
+        if derived is not None:
+            pyramid = SlicePyramid(derived_frame(*derived, var_name, t, lev))
+        else:
+            pyramid = get_pyramid(self.dataset, t, lev, var_name)
+        return pyramid, vmin, vmax
+
+    async def _update_bokeh(self):
+        # Only a new float32 array goes to the browser; no server-side rendering
+        if self._bokeh_view is None:
+            return
+        state = self._view_state()
+        loop = asyncio.get_running_loop()
+        try:
+            pyramid, vmin, vmax = await loop.run_in_executor(
+                None, self._bokeh_frame, self.time_index, self.var_name, self._derived())
+        except Exception as e:
+            print(f"bokeh update failed for {self.dataset} {self.var_name} t={self.time_index}: {e}")
+            return
+        # A newer update has been scheduled for the state the user moved on to
+        if self._view_state() != state or self.backend != "bokeh":
+            return
+        self._bokeh_view.show(pyramid, vmin, vmax)
+
+    async def _render_png(self):
+        # Runs on the event loop; the read and render happen in the engine's
+        # workers so other sessions keep responding meanwhile
+        if self._rendering:
+            self._stale = True
+            return
+        self._rendering = True
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._png_pane.loading = True
+                self._stale = False
+                state = self._view_state()
+                t, var_name, derived = self.time_index, self.var_name, self._derived()
+                lev, vmin, vmax, future = await loop.run_in_executor(None, self._submit_frame,
+                                                                     t, var_name, derived)
+                if not future.done() and derived is None:
+                    # The preview reads nothing from the run itself
+                    preview = await loop.run_in_executor(None, self._preview_png,
+                                                         t, lev, var_name, vmin, vmax)
+                    if self._stale and self._view_state() != state:
+                        # Moved on: the full-resolution frame is not shown
+                        continue
+                    if preview is not None and not future.done() and self.backend == "png":
+                        self._png_pane.object = io.BytesIO(preview)
+                        self._png_pane.loading = False
+                png = await asyncio.wrap_future(future)
+                # Requests that ended up back at the rendered state need no second render
+                if self._stale and self._view_state() != state:
+                    continue
+                self._stale = False
+                if self.backend == "png":
+                    self._png_pane.object = io.BytesIO(png)
+                    # Start on the neighbouring frames while the user looks at this one
+                    await loop.run_in_executor(None, partial(
+                        self._prefetcher.schedule, self.dataset, t, lev, var_name,
+                        ntime=self.metadata["ntime"], vmin=vmin, vmax=vmax,
+                        frame_bytes=len(png), derived=derived))
+                break
+        except Exception as e:
+            print(f"render failed for {self.dataset} {self.var_name} t={self.time_index}: {e}")
+        finally:
+            self._rendering = False
+            self._png_pane.loading = False
+            if self._stale:
+                # A request arrived while the failed render ran; serve it now
+                self._stale = False
+                pn.state.execute(self._render_png)
 
     def panel(self):
+        self._switch_backend()
         return pn.Column(
             pn.pane.Markdown(f"### {self.dataset}"),
             self.var_row,
             self.slider_row,
-            self.view,
+            self.derived_row,
+            self.probe_row,
+            self.play_row,
+            pn.Row(self._plot_area, self._probe_view.pane, sizing_mode="stretch_width"),
             align="center",
             sizing_mode="stretch_width",
             height=None,
@@ -0,0 +1,317 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import dask
+import xarray as xr
+from dask.array.core import getter, getter_inline, getter_nofancy
+from dask.callbacks import Callback
+
+# Process-wide pool of open forecast runs so a slider move does not re-glob,
+# re-open and re-concatenate every NetCDF file of the run.
+POOL_MAX_DATASETS = int(os.environ.get("POOL_MAX_DATASETS", 8))
+POOL_MAX_OPEN_FILES = int(os.environ.get("POOL_MAX_OPEN_FILES", 1024))
+# Seconds between checks of a run's file list/mtimes
+POOL_CHECK_INTERVAL = float(os.environ.get("POOL_CHECK_INTERVAL", 2.0))
+# Times a growing run is extended in place before it is reopened with a flat task graph
+POOL_MAX_APPENDS = int(os.environ.get("POOL_MAX_APPENDS", 32))
+
+# Fallback location for per-run sidecar files when the run directory is read-only
+CACHE_DIR = Path(os.environ.get("CREDIT_PANEL_CACHE", Path.home() / ".cache" / "credit-panel"))
+
+# Single-store copies of a run built by convertRuns.py. Either one is read
+# instead of the run's NetCDF files while its recorded fingerprint matches them.
+ZARR_STORE = "run.zarr"
+REFERENCE_INDEX = "run.references.json"
+FINGERPRINT_ATTR = "credit_fingerprint"
+
+_GETTERS = (getter, getter_inline, getter_nofancy)
+
+# xarray keeps its own LRU of OS-level file handles; keep it in step with the pool
+xr.set_options(file_cache_maxsize=POOL_MAX_OPEN_FILES)
+
+
+def dataset_files(path) -> list[Path]:
+    """Sorted list of the NetCDF files making up a run."""
+    return sorted(Path(path).glob("*.nc"))
+
+
+def dataset_fingerprint(path) -> tuple:
+    """(name, mtime, size) of every file in a run; changes when files land or are rewritten."""
+    fingerprint = []
+    for f in dataset_files(path):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        fingerprint.append((f.name, st.st_mtime_ns, st.st_size))
+    return tuple(fingerprint)
+
+
+def fingerprint_digest(fingerprint) -> str:
+    """Stable short digest of a fingerprint, the same in every process and after a restart."""
+    return hashlib.sha1(repr([list(f) for f in fingerprint]).encode()).hexdigest()[:16]
+
+
+def cache_path(path, name: str) -> Path:
+    """Location of a cache file for a run under CACHE_DIR; writing it leaves the run directory alone."""
+    path = Path(path)
+    digest = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:16]
+    return CACHE_DIR / f"{path.name}-{digest}" / name
+
+
+def sidecar_path(path, name: str) -> Path:
+    """Where to keep a cache file for a run: next to its files, or under CACHE_DIR."""
+    path = Path(path)
+    if os.access(path, os.W_OK):
+        return path / name
+    return cache_path(path, name)
+
+
+def run_stores(path) -> list:
+    """(kind, location) of each converted store next to a run or in its cache dir."""
+    stores = []
+    for kind, name in (("zarr", ZARR_STORE), ("references", REFERENCE_INDEX)):
+        for location in dict.fromkeys((Path(path) / name, sidecar_path(path, name))):
+            if location.exists():
+                stores.append((kind, location))
+    return stores
+
+
+def open_run_store(path, fingerprint, chunks=None):
+    """The first converted store of a run that matches fingerprint, as a Dataset; else None."""
+    for kind, location in run_stores(path):
+        try:
+            if kind == "zarr":
+                ds = xr.open_zarr(location, consolidated=True, chunks=chunks)
+            else:
+                ds = xr.open_dataset("reference://", engine="zarr", chunks=chunks,
+                                     backend_kwargs={"consolidated": False, "zarr_format": 2,
+                                                     "storage_options": {"fo": str(location)}})
+        except Exception as e:
+            print(f"pool: could not open {location}: {e}")
+            continue
+        if ds.attrs.get(FINGERPRINT_ATTR) == [list(f) for f in fingerprint]:
+            return ds
+        print(f"pool: {location} is out of date")
+        ds.close()
+    return None
+
+
+def open_run(path, fingerprint, chunks=None):
+    """Open a run from its converted store when usable, else from its NetCDF files."""
+    ds = open_run_store(path, fingerprint, chunks)
+    if ds is not None:
+        return ds
+    files = [str(Path(path) / name) for name, _, _ in fingerprint]
+    return xr.open_mfdataset(files, engine="netcdf4", autoclose=True, chunks=chunks)
+
+
+class ReadCounter(Callback):
+    """Dask callback that adds up the bytes returned by array getter tasks, i.e. the chunk reads."""
+
+    def __init__(self):
+        super().__init__()
+        self.nbytes = 0
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        task = dsk[key]
+        func = task[0] if isinstance(task, tuple) else getattr(task, "func", None)
+        if func in _GETTERS:
+            self.nbytes += getattr(result, "nbytes", 0)
+
+
+def read_values(da):
+    """(values, bytes read from the store) of a DataArray.
+
+    The chunk reads are measured with a ReadCounter scoped to this compute.
+    The graph is not optimised so the getter tasks stay visible; with the
+    pool's one-slice chunks there is nothing for optimisation to fuse away.
+    """
+    if da.chunks is None:
+        values = da.values
+        return values, values.nbytes
+    counter = ReadCounter()
+    # The scheduler takes callbacks in their tuple form
+    values, = dask.compute(da.data, optimize_graph=False, callbacks=[counter._callback])
+    return values, counter.nbytes
+
+
+def extends_fingerprint(old, new) -> bool:
+    """True when new only adds files after those of old and none of old's files changed."""
+    return len(new) > len(old) and list(new[:len(old)]) == list(old)
+
+
+class _PoolEntry:
+    def __init__(self, ds, fingerprint):
+        self.ds = ds
+        self.fingerprint = fingerprint
+        self.nfiles = len(fingerprint)
+        self.refcount = 0
+        self.retired = False
+        # Opened from the NetCDF files rather than a converted store
+        self.from_files = FINGERPRINT_ATTR not in ds.attrs
+        self.appends = 0
+
+
+class DatasetPool:
+    def __init__(self, max_datasets=POOL_MAX_DATASETS, max_open_files=POOL_MAX_OPEN_FILES,
+                 check_interval=POOL_CHECK_INTERVAL, chunks=None, append_dim=None):
+        self.max_datasets = max_datasets
+        self.max_open_files = max_open_files
+        self.check_interval = check_interval
+        # Dask chunks for open_mfdataset; dims missing from a run are ignored
+        self.chunks = chunks
+        # Record dimension new files of a growing run are appended along
+        self.append_dim = append_dim
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def fingerprint(self, path) -> tuple:
+        """File-set fingerprint of a run, re-read from disk at most every check_interval seconds."""
+        key = str(Path(path))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._fingerprints.get(key)
+        if cached is not None and now - cached[0] < self.check_interval:
+            return cached[1]
+        fingerprint = dataset_fingerprint(key)
+        with self._lock:
+            self._fingerprints[key] = (now, fingerprint)
+        return fingerprint
+
+    def digest(self, path) -> str:
+        """fingerprint_digest of a run's current fingerprint, for cache keys."""
+        return fingerprint_digest(self.fingerprint(path))
+
+    @contextmanager
+    def acquire(self, path):
+        """Borrow the open dataset for a run directory.
+
+        The dataset stays open after the block exits; it is closed when it is
+        evicted or its files change and no other caller is still using it.
+        """
+        entry = self._checkout(str(Path(path)))
+        try:
+            yield entry.ds
+        finally:
+            self._release(entry)
+
+    def _checkout(self, key):
+        # Serialise opening/refreshing of one run without blocking the others
+        with self._key_lock(key):
+            fingerprint = self.fingerprint(key)
+            with self._lock:
+                entry = self._entries.get(key)
+                previous = None
+                if entry is not None and entry.fingerprint != fingerprint:
+                    if entry.from_files and self.append_dim and entry.appends < POOL_MAX_APPENDS \
+                            and extends_fingerprint(entry.fingerprint, fingerprint):
+                        previous = self._entries.pop(key)
+                    else:
+                        print("pool: files changed, reopening " + key)
+                        self._retire(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.refcount += 1
+                    return entry
+
+            if not fingerprint:
+                raise FileNotFoundError(f"No NetCDF files found in {key}")
+            ds = self._extend(key, previous, fingerprint) if previous is not None else None
+            if ds is not None:
+                entry = _PoolEntry(ds, fingerprint)
+                entry.appends = previous.appends + 1
+            else:
+                entry = _PoolEntry(open_run(key, fingerprint, self.chunks), fingerprint)
+
+            with self._lock:
+                entry.refcount += 1
+                self._entries[key] = entry
+                self._evict(keep=key)
+            return entry
+
+    def _extend(self, key, previous, fingerprint):
+        """The previous dataset with only the newly landed files opened and appended; None on failure.
+
+        The previous entry's files stay open and are closed with the new
+        dataset, so callers still holding the old one are unaffected.
+        """
+        files = [str(Path(key) / name) for name, _, _ in fingerprint[len(previous.fingerprint):]]
+        try:
+            added = xr.open_mfdataset(files, engine="netcdf4", autoclose=True, chunks=self.chunks)
+            ds = xr.concat([previous.ds, added], dim=self.append_dim, data_vars="minimal",
+                           coords="minimal", compat="override", join="override")
+        except Exception as e:
+            print(f"pool: could not extend {key}, reopening: {e}")
+            with self._lock:
+                previous.retired = True
+                close = previous.refcount == 0
+            if close:
+                previous.ds.close()
+            return None
+
+        def close():
+            previous.ds.close()
+            added.close()
+        ds.set_close(close)
+        print(f"pool: appended {len(files)} file(s) to {key}")
+        return ds
+
+    def _release(self, entry):
+        with self._lock:
+            entry.refcount -= 1
+            close = entry.retired and entry.refcount == 0
+        if close:
+            entry.ds.close()
+
+    def _retire(self, key):
+        # Caller holds self._lock
+        entry = self._entries.pop(key)
+        entry.retired = True
+        if entry.refcount == 0:
+            entry.ds.close()
+
+    def _evict(self, keep):
+        # Caller holds self._lock; drop least recently used runs over either cap
+        def over_cap():
+            nfiles = sum(e.nfiles for e in self._entries.values())
+            return len(self._entries) > self.max_datasets or nfiles > self.max_open_files
+
+        while over_cap():
+            key = next((k for k in self._entries if k != keep), None)
+            if key is None:
+                break
+            print("pool: evicting " + key)
+            self._retire(key)
+
+    def recheck(self, path):
+        """Look at a run's files again on the next lookup, keeping it open so new files are appended."""
+        with self._lock:
+            self._fingerprints.pop(str(Path(path)), None)
+
+    def invalidate(self, path=None):
+        """Forget one run (or every run) so the next acquire reopens it."""
+        with self._lock:
+            keys = list(self._entries) if path is None else [str(Path(path))]
+            for key in keys:
+                self._fingerprints.pop(key, None)
+                if key in self._entries:
+                    self._retire(key)
+
+    def close_all(self):
+        self.invalidate()
+
+
+DATASET_POOL = DatasetPool()
@@ -0,0 +1,199 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import xarray as xr
+
+from datasetPool import CACHE_DIR, dataset_files, dataset_fingerprint, extends_fingerprint, open_run_store
+from gridGeometry import GridGeometry, register_grid
+from era5_plot import TIME_NAME, LEV_NAME, PRES_NAME, LAT_NAME, LON_NAME
+
+# Runs are scanned concurrently; processes by default because the NetCDF
+# library serialises header reads between threads of one process. They are
+# spawned, not forked: the server already has render, job and watcher threads
+# that may hold HDF5/NetCDF locks at the moment of a fork.
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", min(16, os.cpu_count() or 1)))
+SCAN_MODE = os.environ.get("SCAN_MODE", "process")
+METADATA_CACHE = CACHE_DIR / "metadata.json"
+METADATA_VERSION = 2
+
+# Process-wide metadata for every run, shared by all sessions
+DATASET_METADATA = {}
+_SCAN_LOCK = threading.Lock()
+# Data directories already scanned by scan_once() in this process
+_SCANNED = set()
+_ONCE_LOCK = threading.Lock()
+
+
+def _header_metadata(ds) -> dict:
+    return {
+        "nlev": int(ds.sizes.get(LEV_NAME, 0)),
+        "nplev": int(ds.sizes.get(PRES_NAME, 0)),
+        "nlat": int(ds.sizes[LAT_NAME]),
+        "nlon": int(ds.sizes[LON_NAME]),
+        "vars2d": [v for v in ds.data_vars if len(ds[v].dims) <= 3],
+        "vars3d": [v for v in ds.data_vars if len(ds[v].dims) > 3],
+        # Lat flip / lon wrap of the grid, so frame reads skip recomputing them
+        "grid": GridGeometry.from_coords(ds[LON_NAME].values, ds[LAT_NAME].values).to_dict(),
+    }
+
+
+def _time_range(metadata, times):
+    metadata["ntime"] = len(times)
+    metadata["stime"] = str(times[0].astype("datetime64[s]"))
+    metadata["etime"] = str(times[-1].astype("datetime64[s]"))
+    return metadata
+
+
+def scan_dataset(path) -> dict | None:
+    """Metadata for one run from file headers and coordinates only; None if it has no files."""
+    files = dataset_files(path)
+    if not files:
+        return None
+
+    # A converted store has the whole run's metadata in one place
+    ds = open_run_store(path, dataset_fingerprint(path))
+    if ds is not None:
+        with ds:
+            return _time_range(_header_metadata(ds), ds[TIME_NAME].values)
+
+    with xr.open_dataset(files[0], engine="netcdf4") as ds:
+        metadata = _header_metadata(ds)
+
+    # Only the time coordinate is read from the remaining files
+    times = []
+    for f in files:
+        with xr.open_dataset(f, engine="netcdf4") as ds:
+            times.extend(ds[TIME_NAME].values)
+    return _time_range(metadata, times)
+
+
+def extend_dataset(path, metadata, names) -> dict:
+    """Metadata of a run after the files in names were appended; only their time coordinates are read."""
+    times = []
+    for name in names:
+        with xr.open_dataset(Path(path) / name, engine="netcdf4") as ds:
+            times.extend(ds[TIME_NAME].values)
+    extended = dict(metadata)
+    extended["ntime"] = metadata["ntime"] + len(times)
+    if times:
+        extended["etime"] = str(times[-1].astype("datetime64[s]"))
+    return extended
+
+
+def _load_cache() -> dict:
+    try:
+        with open(METADATA_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != METADATA_VERSION:
+        return {}
+    return cache.get("runs", {})
+
+
+def _save_cache(runs):
+    try:
+        METADATA_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = METADATA_CACHE.with_name(METADATA_CACHE.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": METADATA_VERSION, "runs": runs}, f)
+        os.replace(tmp, METADATA_CACHE)
+    except OSError as e:
+        print(f"scan: could not write {METADATA_CACHE}: {e}")
+
+
+def scan_datasets(data_dir, metadata=DATASET_METADATA, workers=SCAN_WORKERS, mode=SCAN_MODE,
+                  names=None, failed=None) -> list[str]:
+    """Bring metadata up to date for every run under data_dir, or only the given run names.
+
+    Runs whose file names/mtimes match the on-disk cache are not opened, and
+    runs that only gained files (a forecast still being written) read just
+    the new files. Returns the names of the runs that were (re)scanned;
+    runs that could not be read (e.g. a file still being written) are added
+    to the failed set when one is given.
+    """
+    with _SCAN_LOCK:
+        runs = _load_cache()
+        dirs = sorted(d for d in Path(data_dir).iterdir() if d.is_dir())
+        if names is not None:
+            dirs = [d for d in dirs if d.name in names]
+
+        todo = []
+        extended = []
+        for d in dirs:
+            fingerprint = [list(f) for f in dataset_fingerprint(d)]
+            cached = runs.get(str(d))
+            if cached is not None and cached["fingerprint"] == fingerprint:
+                metadata[d.name] = cached["metadata"]
+                register_grid(d, GridGeometry.from_dict(cached["metadata"]["grid"]))
+            elif cached is not None and extends_fingerprint(cached["fingerprint"], fingerprint):
+                added = [name for name, _, _ in fingerprint[len(cached["fingerprint"]):]]
+                try:
+                    result = extend_dataset(d, cached["metadata"], added)
+                except Exception as e:
+                    print(f"scan: could not extend {d}, rescanning: {e}")
+                    todo.append((d, fingerprint))
+                    continue
+                metadata[d.name] = result
+                register_grid(d, GridGeometry.from_dict(result["grid"]))
+                runs[str(d)] = {"fingerprint": fingerprint, "metadata": result}
+                extended.append(d.name)
+            else:
+                todo.append((d, fingerprint))
+
+        present = {d.name for d in dirs}
+        removed = [name for name in metadata
+                   if name not in present and (names is None or name in names)]
+        for name in removed:
+            del metadata[name]
+            runs.pop(str(Path(data_dir) / name), None)
+
+        if not todo:
+            if removed or extended:
+                _save_cache(runs)
+            return extended
+
+        print(f"scan: {len(todo)} of {len(dirs)} runs need scanning")
+        nworkers = max(1, min(workers, len(todo)))
+        if mode == "process" and len(todo) > 1:
+            executor = ProcessPoolExecutor(max_workers=nworkers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            executor = ThreadPoolExecutor(max_workers=nworkers)
+        with executor:
+            futures = {executor.submit(scan_dataset, d): (d, fp) for d, fp in todo}
+            for future, (d, fingerprint) in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"scan: skipping {d}: {e}")
+                    if failed is not None:
+                        failed.add(d.name)
+                    continue
+                if result is None:
+                    continue
+                metadata[d.name] = result
+                register_grid(d, GridGeometry.from_dict(result["grid"]))
+                runs[str(d)] = {"fingerprint": fingerprint, "metadata": result}
+
+        _save_cache(runs)
+        return extended + [d.name for d, _ in todo if failed is None or d.name not in failed]
+
+
+def scan_once(data_dir, metadata=DATASET_METADATA) -> bool:
+    """scan_datasets() for data_dir the first time it is asked for in this process.
+
+    Later calls (e.g. from every new browser session) return False at once;
+    the dataset watcher keeps the metadata current from then on. A call
+    made while the first scan runs waits for it.
+    """
+    key = str(Path(data_dir))
+    with _ONCE_LOCK:
+        if key in _SCANNED:
+            return False
+        scan_datasets(data_dir, metadata)
+        _SCANNED.add(key)
+        return True
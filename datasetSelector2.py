@@ -1,122 +1,216 @@
+import os
+
 import pandas as pd
 import panel as pn
 import param
 
 # Initialize the extension (standard for Jupyter/Casper environments)
-pn.extension()
+pn.extension("tabulator")
+
+# Rows sent to the browser at a time; the rest stay on the server
+BROWSER_PAGE_SIZE = int(os.environ.get("BROWSER_PAGE_SIZE", 50))
+# Pause in typing (ms) before the filter is applied; Enter applies it at once
+FILTER_DEBOUNCE_MS = int(os.environ.get("FILTER_DEBOUNCE_MS", 250))
+
+SORT_OPTIONS = {
+    "Name": (["name"], [True]),
+    "Start time": (["start", "name"], [False, True]),
+    "Variables": (["variables", "name"], [False, True]),
+}
+
 
 class DatasetBrowser(param.Parameterized):
+    """Paged, filterable list of runs.
+
+    The full list lives in a DataFrame on the server. Filtering and sorting
+    happen there, and only the current page of rows is sent to the browser.
+    Ticking a row's checkbox adds the run to checked_items. Clicking a row
+    makes it the active_dataset; the highlight is a patch to the old and
+    new active rows only, found through a name -> row index of the view.
+    The filter is applied once typing pauses, and a refresh that leaves
+    the rows in place only patches the cells that changed.
+    """
+
     # Track multi-select state
     checked_items = param.List(default=[])
     # Track single "active" focus state
     active_dataset = param.String(default="")
+    filter_text = param.String(default="")
+    sort_by = param.Selector(default="Name", objects=list(SORT_OPTIONS))
 
-    def __init__(self, datasets, **params):
+    def __init__(self, datasets, metadata=None, page_size=BROWSER_PAGE_SIZE, **params):
         super().__init__(**params)
-        self.datasets = datasets
-        print(self.datasets)
-        # Storage for row objects to allow dynamic style updates
+        self.datasets = list(datasets)
+        # Run metadata (start time, variables) for sorting and filtering; may be filled in later
+        self.metadata = metadata if metadata is not None else {}
+        self._updating = False
+        self._column = None
+        self._frame = self._build_frame()
+        # Row of each run in the current view
         self._rows = {}
+        self._doc = pn.state.curdoc
+        self._filter_timer = None
 
-    def _get_row_style(self, name):
-        """Calculates the CSS for a row based on whether it is active."""
-        is_active = (name == self.active_dataset)
-        return {
-            'background': '#e8f2ff' if is_active else 'transparent',
-            'border-left': '5px solid #007bff' if is_active else '5px solid transparent',
-            'display': 'flex',
-            'align-items': 'center',
-            'width': '100%',
-            'border-radius': '0 4px 4px 0',
-            'transition': 'background 0.2s', # Smooth color transition
-            'padding' : '0px 2px',
-            'margin' : '0pz'
-        }
-
-    def _set_active(self, name):
-        """Centralized logic to move the highlight and refresh the UI."""
-        self.active_dataset = name
-        self._update_ui()
-
-    def _make_row(self, name):
-        # 1. Checkbox for multi-select
-        # align='center' and specific margins ensure vertical centering with text
-        cb = pn.widgets.Checkbox(
-            name="", value=False, width=10, 
-            align='center', margin=(10, 0, 2, 0) 
+        self.filter_input = pn.widgets.TextInput(
+            name="", placeholder="Filter by name or variable...",
+            sizing_mode="stretch_width", margin=(0, 0, 5, 0)
         )
-        
-        def update_checked(event):
-            current = list(self.checked_items)
-            if event.new:
-                if name not in current: current.append(name)
-                # Highlight the row when the box is checked
-                self._set_active(name)
-            else:
-                if name in current: current.remove(name)
-            self.checked_items = current
-            
-        cb.param.watch(update_checked, 'value')
-
-        # 2. Button styled as a flat label for single-select/highlight
-        # align='center' and line-height: 30px match the checkbox height
-        btn = pn.widgets.Button(
-            name=name, 
-            button_type='default', 
-            sizing_mode='stretch_width',
-            align='center',
+        self.filter_input.link(self, value="filter_text")
+        self.filter_input.param.watch(self._on_filter_input, "value_input")
+        self.sort_select = pn.widgets.Select(name="", options=list(SORT_OPTIONS), value=self.sort_by,
+                                             width=110, margin=(0, 0, 5, 5))
+        self.sort_select.link(self, value="sort_by")
+
+        self.table = pn.widgets.Tabulator(
+            self._view(),
+            pagination="remote",
+            page_size=page_size,
+            selectable="checkbox",
+            disabled=True,
+            show_index=False,
+            header_filters=False,
+            hidden_columns=["start", "variables", "search"],
+            titles={"active": "", "name": "Dataset"},
+            widths={"active": 12},
+            configuration={"headerSort": False},
+            sizing_mode="stretch_width",
             stylesheets=["""
-                .bk-btn {
-                    background: transparent !important;
-                    border: none !important;
-                    box-shadow: none !important;
-                    text-align: left !important;
-                    padding-left: 5px !important;
-                    line-height: 6px !important;
-                    font-size: 14px !important;
-                    color: #333 !important;
-                    cursor: pointer;
-                    outline: none !important;
-                    box-shadow: none !important;
-                }
-                .bk-btn:hover { 
-                    background: rgba(0,0,0,0.05) !important; 
-                }
+                .tabulator-cell[tabulator-field="active"] { color: #007bff; padding: 0 !important; }
             """]
         )
-        
-        # Highlight row when the dataset name is clicked
-        btn.on_click(lambda event: self._set_active(name))
-
-        # 3. Create the Row container
-        row = pn.Row(
-            cb, 
-            btn, 
-            styles=self._get_row_style(name), 
-            sizing_mode='stretch_width',
-            margin=0
-        )
-        
-        self._rows[name] = row
-        return row
+        self.table.param.watch(self._on_selection, "selection")
+        self.table.on_click(self._on_click)
+        self._index_rows()
+        self._sync_selection()
+
+    def _build_frame(self):
+        rows = []
+        for name in self.datasets:
+            meta = self.metadata.get(name, {})
+            variables = meta.get("vars2d", []) + meta.get("vars3d", [])
+            rows.append({
+                "name": name,
+                "start": meta.get("stime", ""),
+                "variables": len(variables),
+                "search": " ".join([name] + variables).lower(),
+            })
+        return pd.DataFrame(rows, columns=["name", "start", "variables", "search"])
+
+    def _view(self):
+        """The filtered, sorted frame shown in the table, with a marker column for the active run."""
+        frame = self._frame
+        text = self.filter_text.strip().lower()
+        if text:
+            frame = frame[frame["search"].str.contains(text, regex=False)]
+        columns, ascending = SORT_OPTIONS[self.sort_by]
+        frame = frame.sort_values(columns, ascending=ascending, kind="stable").reset_index(drop=True)
+        frame.insert(0, "active", (frame["name"] == self.active_dataset).map({True: "\u258c", False: ""}))
+        return frame
+
+    def _index_rows(self):
+        self._rows = {name: i for i, name in enumerate(self.table.value["name"])}
 
-    def _update_ui(self):
-        """Forces the CSS styles of all rows to refresh."""
-        for name, row in self._rows.items():
-            row.styles = self._get_row_style(name)
-            # Explicitly trigger the parameter update for older Panel versions
-            row.param.trigger('styles')
+    def _refresh(self):
+        view = self._view()
+        current = self.table.value
+        if len(view) == len(current) and list(view.columns) == list(current.columns) \
+                and (view["name"].values == current["name"].values).all():
+            # Same rows in the same order: send only the cells that differ
+            patch = {}
+            for column in view.columns:
+                changed = (view[column] != current[column]).to_numpy().nonzero()[0]
+                if len(changed):
+                    patch[column] = [(int(i), view[column].iloc[i]) for i in changed]
+            if patch:
+                self.table.patch(patch)
+        else:
+            self.table.value = view
+            self._index_rows()
+        self._sync_selection()
+
+    def _sync_selection(self):
+        # Tick the checked runs that are part of the current view
+        selection = sorted(self._rows[name] for name in self.checked_items if name in self._rows)
+        if selection != sorted(self.table.selection):
+            self._updating = True
+            try:
+                self.table.selection = selection
+            finally:
+                self._updating = False
+
+    def _on_filter_input(self, event):
+        if self._doc is None or self._doc.session_context is None or FILTER_DEBOUNCE_MS == 0:
+            self.filter_text = event.new
+            return
+        # Watchers may run in Panel's worker threads; the timeout is managed on the loop
+        self._doc.add_next_tick_callback(self._restart_filter_timer)
+
+    def _restart_filter_timer(self):
+        # Restarted on every keystroke, so the view is rebuilt once typing pauses
+        if self._filter_timer is not None:
+            self._doc.remove_timeout_callback(self._filter_timer)
+        self._filter_timer = self._doc.add_timeout_callback(self._apply_filter, FILTER_DEBOUNCE_MS)
+
+    def _apply_filter(self):
+        self._filter_timer = None
+        self.filter_text = self.filter_input.value_input or ""
+
+    @param.depends("filter_text", "sort_by", watch=True)
+    def _on_view_change(self):
+        self._refresh()
+
+    def _on_selection(self, event):
+        if self._updating:
+            return
+        names = self.table.value["name"]
+        selected = [names.iloc[i] for i in event.new]
+        # Checked runs filtered out of view stay checked
+        checked = [d for d in self.checked_items if d not in self._rows or d in selected]
+        added = [d for d in selected if d not in checked]
+        self.checked_items = checked + added
+        if added:
+            # Highlight the row when the box is checked
+            self._set_active(added[-1])
+
+    def _on_click(self, event):
+        if event.column == "_selection":
+            return
+        self._set_active(self.table.value["name"].iloc[event.row])
+
+    def _set_active(self, name):
+        """Move the highlight, patching only the previous and the new active rows."""
+        previous = self.active_dataset
+        if name == previous:
+            return
+        self.active_dataset = name
+        patch = [(self._rows[n], mark) for n, mark in ((previous, ""), (name, "\u258c")) if n in self._rows]
+        if patch:
+            self.table.patch({"active": patch})
+
+    def update_datasets(self, datasets):
+        """Take a new list of runs (and any metadata that changed); the current filter, sort and page stay."""
+        datasets = list(datasets)
+        removed = [d for d in self.datasets if d not in datasets]
+        self.datasets = datasets
+        self._frame = self._build_frame()
+
+        if any(name in self.checked_items for name in removed):
+            self.checked_items = [d for d in self.checked_items if d not in removed]
+        if self.active_dataset in removed:
+            self.active_dataset = ""
+        self._refresh()
 
     @property
     def panel(self):
-        """Returns the scrollable list of datasets."""
-        return pn.Column(
-            *[self._make_row(d) for d in self.datasets],
-            sizing_mode='stretch_width',
-            max_height=600,
-            scroll=True,
-            styles={'border': '1px solid #ddd', 'border-radius': '4px', 'background': 'white'}
-        )
+        """Returns the filter/sort controls and the paged list of datasets."""
+        if self._column is None:
+            self._column = pn.Column(
+                pn.Row(self.filter_input, self.sort_select, sizing_mode="stretch_width", margin=0),
+                self.table,
+                sizing_mode="stretch_width",
+                styles={'border': '1px solid #ddd', 'border-radius': '4px', 'background': 'white'}
+            )
+        return self._column
 
 # --- App Construction ---
 
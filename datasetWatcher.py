@@ -0,0 +1,149 @@
+import os
+import threading
+from pathlib import Path
+
+from datasetScan import DATASET_METADATA, scan_datasets
+from datasetPool import DATASET_POOL
+from era5_plot import STATS_INDEX
+from jobQueue import JOB_QUEUE
+
+# Seconds between polls of DATA_DIR
+WATCH_INTERVAL = float(os.environ.get("WATCH_INTERVAL", 10.0))
+# Seconds between polls while an inference job is running and writing forecast steps
+JOB_WATCH_INTERVAL = float(os.environ.get("JOB_WATCH_INTERVAL", 2.0))
+
+
+class DatasetWatcher:
+    """Polls a data directory in a background thread and rescans only runs that changed.
+
+    A run counts as changed when its directory appears, disappears or its
+    mtime moves (files added, removed or renamed). Subscribers are called
+    from the watcher thread with (added, changed, removed) lists of run names.
+
+    While a job of job_queue is running the directory is polled every
+    job_interval seconds, and once more as soon as a job starts or ends, so
+    forecast steps show up while the run is still being written. Colour
+    statistics of changed runs are brought up to date here too, one new
+    file at a time, before any plot asks for them.
+    """
+
+    def __init__(self, data_dir, metadata=DATASET_METADATA, interval=WATCH_INTERVAL,
+                 job_queue=None, job_interval=JOB_WATCH_INTERVAL):
+        self.data_dir = Path(data_dir)
+        self.metadata = metadata
+        self.interval = interval
+        self.job_queue = job_queue
+        self.job_interval = job_interval
+        self._mtimes = {}
+        # Runs whose files could not be read yet, looked at again on the next poll
+        self._retry = set()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        if job_queue is not None:
+            job_queue.subscribe(lambda job: self._wake.set())
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._mtimes = self._run_mtimes()
+        self._thread = threading.Thread(target=self._loop, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run_mtimes(self):
+        mtimes = {}
+        try:
+            entries = list(os.scandir(self.data_dir))
+        except OSError as e:
+            print(f"watcher: cannot list {self.data_dir}: {e}")
+            return self._mtimes
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    mtimes[entry.name] = entry.stat().st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def _interval(self):
+        if self.job_queue is not None and self.job_queue.active():
+            return min(self.interval, self.job_interval)
+        return self.interval
+
+    def _loop(self):
+        while True:
+            try:
+                interval = self._interval()
+            except Exception as e:
+                print(f"watcher: no job status: {e}")
+                interval = self.interval
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"watcher: poll failed: {e}")
+
+    def poll(self):
+        """Check once for new, changed or removed runs and notify subscribers."""
+        mtimes = self._run_mtimes()
+        added = sorted(set(mtimes) - set(self._mtimes))
+        removed = sorted(set(self._mtimes) - set(mtimes))
+        changed = sorted(name for name in set(mtimes) & set(self._mtimes)
+                         if mtimes[name] != self._mtimes[name] or name in self._retry)
+        self._mtimes = mtimes
+        if not (added or removed or changed):
+            return
+
+        print(f"watcher: added {added} changed {changed} removed {removed}")
+        failed = set()
+        scan_datasets(self.data_dir, self.metadata, names=set(added + changed + removed), failed=failed)
+        self._retry = failed
+        for name in added + changed:
+            if name not in self.metadata:
+                continue
+            try:
+                DATASET_POOL.recheck(self.data_dir / name)
+                STATS_INDEX.refresh(self.data_dir / name)
+            except Exception as e:
+                print(f"watcher: statistics for {name} failed: {e}")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(added, changed, removed)
+            except Exception as e:
+                print(f"watcher: subscriber failed: {e}")
+
+
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def get_watcher(data_dir) -> DatasetWatcher:
+    """The process-wide, already started watcher for a data directory."""
+    key = str(Path(data_dir))
+    with _WATCHERS_LOCK:
+        watcher = _WATCHERS.get(key)
+        if watcher is None:
+            watcher = _WATCHERS[key] = DatasetWatcher(key, job_queue=JOB_QUEUE)
+            watcher.start()
+    return watcher
@@ -0,0 +1,128 @@
+import os
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+from datasetPool import DATASET_POOL
+from era5_plot import STATS_INDEX, dataset_path, read_frame, render_frame
+
+# Fields computed from several runs at the same step index:
+#   difference  first member minus the reference
+#   mean, std   across the members
+#   rmse        across the members against the reference
+DERIVED_KINDS = ["difference", "mean", "std", "rmse"]
+DERIVED_CMAPS = {"difference": "RdBu_r"}
+# Derived 2D slices (and colour ranges) kept in memory
+DERIVED_CACHE_SIZE = int(os.environ.get("DERIVED_CACHE_SIZE", 32))
+
+_FRAMES = OrderedDict()
+_LIMITS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _stack(runs, var_name, t, lev):
+    # One 2D slice per run, stacked along a new leading axis
+    frames = [read_frame(run, t, lev, var_name) for run in runs]
+    first = frames[0]
+    for run, frame in zip(runs[1:], frames[1:]):
+        if frame["arr"].shape != first["arr"].shape or frame["extent"] != first["extent"]:
+            raise ValueError(f"{run} is on a different grid than {runs[0]}")
+    return np.stack([f["arr"] for f in frames]), first
+
+
+def _compute(kind, members, reference, var_name, t, lev) -> dict:
+    runs = list(members) + ([reference] if reference else [])
+    stack, first = _stack(runs, var_name, t, lev)
+    # All-NaN columns (e.g. masked land points) are expected; they stay NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if kind == "difference":
+            arr = stack[0] - stack[-1]
+            label = f"{members[0]} - {reference}"
+        elif kind == "mean":
+            arr = np.nanmean(stack, axis=0)
+            label = f"mean of {len(members)} runs"
+        elif kind == "std":
+            arr = np.nanstd(stack, axis=0)
+            label = f"std of {len(members)} runs"
+        elif kind == "rmse":
+            arr = np.sqrt(np.nanmean((stack[:-1] - stack[-1]) ** 2, axis=0))
+            label = f"RMSE of {len(members)} runs vs {reference}"
+        else:
+            raise ValueError(f"Unknown derived field '{kind}', expected one of {DERIVED_KINDS}")
+    # Keep the time part of the member title ("... - t=3 - 2026-01-01 18:00 UTC")
+    when = first["title"].split(" - ", 1)[-1]
+    return {
+        "arr": arr.astype(first["arr"].dtype, copy=False),
+        "extent": first["extent"],
+        "title": f"{var_name} {label} - {when}",
+        "units": first["units"],
+    }
+
+
+def _run_digests(runs) -> tuple:
+    return tuple(DATASET_POOL.digest(dataset_path(r)) for r in runs)
+
+
+def derived_frame(kind, members, reference, var_name, t, lev) -> dict:
+    """A derived slice in the load_frame format, cached until one of the runs' files change."""
+    runs = tuple(members) + ((reference,) if reference else ())
+    key = (kind, tuple(members), reference, var_name, t, lev, _run_digests(runs))
+    with _LOCK:
+        frame = _FRAMES.get(key)
+        if frame is not None:
+            _FRAMES.move_to_end(key)
+            return frame
+
+    frame = _compute(kind, tuple(members), reference, var_name, t, lev)
+    with _LOCK:
+        _FRAMES[key] = frame
+        while len(_FRAMES) > DERIVED_CACHE_SIZE:
+            _FRAMES.popitem(last=False)
+    return frame
+
+
+def derived_limits(kind, members, reference, var_name, lev):
+    """Colour range for a derived view from the runs' stored statistics, the same at every step.
+
+    With lo, hi the widest 1st/99th percentiles of the variable over the
+    runs, a mean lies in (lo, hi), a difference or RMSE is at most hi - lo
+    in size and a std at most half that; differences get a range
+    symmetric about zero, spreads and errors start at zero.
+    """
+    runs = tuple(members) + ((reference,) if reference else ())
+    key = (kind, tuple(members), reference, var_name, lev, _run_digests(runs))
+    with _LOCK:
+        limits = _LIMITS.get(key)
+        if limits is not None:
+            _LIMITS.move_to_end(key)
+            return limits
+
+    dirs = [dataset_path(r) for r in runs]
+    lo, hi = STATS_INDEX.shared_limits(dirs, var_name, lev, percentile=True)
+    width = (hi - lo) or 1.0
+    if kind == "difference":
+        limits = (-width, width)
+    elif kind == "rmse":
+        limits = (0.0, width)
+    elif kind == "std":
+        limits = (0.0, width / 2)
+    else:
+        limits = (lo, hi)
+    # Ranges from runs still being indexed are worked out again next time
+    if all(STATS_INDEX.indexed(d) for d in dirs):
+        with _LOCK:
+            _LIMITS[key] = limits
+            while len(_LIMITS) > DERIVED_CACHE_SIZE:
+                _LIMITS.popitem(last=False)
+    return limits
+
+
+def derived_png(kind, members, reference, var_name, t, lev, vmin=None, vmax=None):
+    """PNG of a derived view, drawn like plot_png."""
+    frame = derived_frame(kind, members, reference, var_name, t, lev)
+    if vmin is None or vmax is None:
+        vmin, vmax = derived_limits(kind, members, reference, var_name, lev)
+    return render_frame(frame, f"{var_name}:{kind}", vmin, vmax, cmap=DERIVED_CMAPS.get(kind))
@@ -1,17 +1,18 @@
-import xarray as xr
 import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use("Agg")
-import threading
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import cartopy.crs as ccrs
-import io
 import os
 
 from pathlib import Path
-
-PLOT_LOCK = threading.Lock()
+from datasetPool import DATASET_POOL, read_values
+from colorStats import StatsIndex
+from figureTemplate import FIGURE_TEMPLATES
+from gridGeometry import GridGeometry, grid_for
+from previewCache import PREVIEW_CACHE, PreviewStore
 
 def newest_directory(parent: str) -> Path | None:
     parent_path = Path(parent)
@@ -38,77 +39,154 @@ LEV_NAME = "level"
 PRES_NAME = "pressure"
 FILL_THRESHOLD = 1.0e20
 
-
-def plot_png(dataset: str, t: int, lev: int, var_name: str = VAR_NAME):
+# Coarse copy of every slice, written by the statistics pass below, so a
+# preview can be shown for a frame nothing has read yet
+PREVIEW_STORE = PreviewStore(time_dim=TIME_NAME, level_dims=(LEV_NAME, PRES_NAME), lat_dim=LAT_NAME,
+                             lon_dim=LON_NAME, fill_threshold=FILL_THRESHOLD)
+
+
+def _write_previews(dataset_dir, name, stamp, ds):
+    PREVIEW_STORE.write(dataset_dir, name, stamp, ds, grid_for(dataset_dir, ds, LON_NAME, LAT_NAME))
+
+
+# Colour limits are looked up here instead of reducing the whole variable per frame
+STATS_INDEX = StatsIndex(level_dims=(LEV_NAME, PRES_NAME), fill_threshold=FILL_THRESHOLD,
+                         on_file=_write_previews)
+
+# One dask chunk per (time, level) slice with the full lat/lon plane, so a
+# frame reads exactly one 2D hyperslab instead of whole time/level blocks
+DATASET_POOL.chunks = {TIME_NAME: 1, LEV_NAME: 1, PRES_NAME: 1, LAT_NAME: -1, LON_NAME: -1}
+DATASET_POOL.append_dim = TIME_NAME
+
+
+def dataset_path(dataset: str) -> Path:
+    """Directory holding a run's NetCDF files; the newest run when dataset is empty."""
+    if dataset == "":
+        netcdf_file = os.environ.get("NETCDF_FILE", str(newest_directory(data_dir)) + "/*.nc")
+        return Path(os.path.dirname(netcdf_file))
+    return Path(data_dir) / dataset
+
+
+def load_frame(ds, var_name: str, t: int, lev: int, grid: GridGeometry = None) -> dict:
+    """Read one 2D slice of a variable plus the coordinates and labels needed to draw it.
+
+    grid is the run's cached GridGeometry; it is derived from ds when not given.
+    """
+    if var_name not in ds.data_vars:
+        raise ValueError(f"Variable '{var_name}' not found in dataset")
+    da = ds[var_name]
+    t = int(np.clip(t, 0, da.sizes[TIME_NAME] - 1))
+
+    indexers = {TIME_NAME: t}
+    if len(da.dims) > 3:
+        if (LEV_NAME in da.dims):
+            indexers[LEV_NAME] = lev
+        elif (PRES_NAME in da.dims):
+            indexers[PRES_NAME] = lev
+    # Both indices are applied lazily, so only the one 2D slice is read
+    slice2d = da.isel(indexers)
+
+    if grid is None:
+        grid = GridGeometry.from_coords(ds[LON_NAME].values, ds[LAT_NAME].values)
+    # Latitude flip, longitude wrap and fill masking in one copy of the slice
+    values, bytes_read = read_values(slice2d)
+    arr = grid.apply(values, FILL_THRESHOLD)
+
+    long_name = getattr(da, "long_name", var_name)
+    units = getattr(da, "units", "")
+    time_val = da[TIME_NAME].isel({TIME_NAME: t}).values
+    time_str = pd.Timestamp(time_val).strftime("%Y-%m-%d %H:%M UTC")
+
+    return {
+        "arr": arr,
+        "extent": list(grid.extent),
+        "title": f"{var_name} ({long_name}) - t={t} - {time_str}",
+        "units": units,
+        "bytes_read": bytes_read,
+    }
+
+
+def read_frame(dataset: str, t: int, lev: int, var_name: str = VAR_NAME) -> dict:
+    """load_frame for a run name, through the dataset pool."""
+    path = dataset_path(dataset)
+    with DATASET_POOL.acquire(path) as ds:
+        return load_frame(ds, var_name, t, lev, grid_for(path, ds, LON_NAME, LAT_NAME))
+
+
+def slice_key(dataset: str, t: int, lev: int, var_name: str) -> tuple:
+    """Key of one 2D slice in the slice caches (pyramids, previews); changes with the run's files."""
+    dataset_dir = str(dataset_path(dataset))
+    return (dataset_dir, DATASET_POOL.digest(dataset_dir), var_name, t, lev)
+
+
+def preview_png(dataset: str, t: int, lev: int, var_name: str, vmin, vmax) -> bytes | None:
+    """Small PNG of a slice's coarse copy without reading the run, or None when there is none.
+
+    The copy comes from PREVIEW_CACHE when this process read the slice,
+    else from PREVIEW_STORE once the statistics pass has indexed the run.
+    """
+    key = slice_key(dataset, t, lev, var_name)
+    if key not in PREVIEW_CACHE:
+        dataset_dir = dataset_path(dataset)
+        arr = PREVIEW_STORE.read(dataset_dir, DATASET_POOL.fingerprint(dataset_dir), var_name, t, lev)
+        if arr is None:
+            return None
+        PREVIEW_CACHE.put(key, arr)
+    return PREVIEW_CACHE.png(key, vmin, vmax)
+
+
+def draw_frame(frame: dict, vmin, vmax, cmap=None) -> Figure:
+    """Draw a frame from load_frame on a new map figure."""
+    # Object-oriented Figure (no pyplot global state) so several threads can
+    # render at once
+    fig = Figure(figsize=(9, 4.5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent([-180, 180, -90, 90], crs=ccrs.PlateCarree())
+
+    #ax.coastlines()
+    # skip coastlines if cartopy data isn't available
+    try:
+        ax.coastlines()
+        ax.set_global()
+    except Exception:
+        pass
+
+    im = ax.imshow(frame["arr"], origin='lower', 
+        extent=frame["extent"],
+        transform=ccrs.PlateCarree(), 
+        vmin=vmin, vmax=vmax, cmap=cmap)
+
+    ax.set_title(frame["title"])
+    fig.colorbar(im, ax=ax, orientation="horizontal", pad=0.05, label=f"{frame['units']}")
+    fig.subplots_adjust(left=0.05, right=0.95, top=0.90, bottom=0.10)
+    return fig
+
+
+def plot_png(dataset: str, t: int, lev: int, var_name: str = VAR_NAME, vmin=None, vmax=None):
     print("time " + str(t) + " lev " + str(lev))
     print("dataset " + str(dataset) +  " var " + var_name)
     print(f"plot time {t}, variable {var_name}")
-    if dataset == "": 
-        NETCDF_FILE = os.environ.get("NETCDF_FILE", str(newest_directory(data_dir)) + "/*.nc")
-        print("dataset is empty " + NETCDF_FILE)
-    else:
-        #NETCDF_FILE = str(Path(data_dir + "/" + dataset) / "/*.nc")
-        NETCDF_FILE = f"{data_dir}/{dataset}/*.nc"
-        print("dataset not empty " + data_dir + " " + dataset + " " + NETCDF_FILE)
-    with PLOT_LOCK:
-        with xr.open_mfdataset(NETCDF_FILE, engine="netcdf4", autoclose=True) as ds:
-            if var_name not in ds.data_vars:
-                raise ValueError(f"Variable '{var_name}' not found in dataset")
-            da = ds[var_name]
-            t = int(np.clip(t, 0, da.sizes[TIME_NAME] - 1))
-
-            slice2d = da.isel({TIME_NAME: t}).astype("float64")
-            if len(slice2d.dims) > 2:
-                if (LEV_NAME in slice2d.dims):
-                    slice2d = slice2d.isel({LEV_NAME: lev}).astype("float64")
-                elif (PRES_NAME in slice2d.dims):
-                    slice2d = slice2d.isel({PRES_NAME: lev}).astype("float64")
-
-            arr = slice2d.values
-            arr = np.where(arr > FILL_THRESHOLD, np.nan, arr)
-
-            lon = ds[LON_NAME].values
-            lat = ds[LAT_NAME].values
-
-            # Invert latitudes if the values are descending
-            if lat[0] > lat[-1]:
-                lat = lat[::-1]
-                arr = arr[::-1, :]
-
-            lon_wrapped = ((lon + 180.0) % 360.0) - 180.0
-            sort_idx = np.argsort(lon_wrapped)
-            lon_sorted = lon_wrapped[sort_idx]
-            arr_sorted = arr[:, sort_idx]
-
-            fig = plt.figure(figsize=(9, 4.5))
-            ax = plt.axes(projection=ccrs.PlateCarree())
-            ax.set_extent([-180, 180, -90, 90], crs=ccrs.PlateCarree())
-
-            #ax.coastlines()
-            # skip coastlines if cartopy data isn't available
-            try:
-                ax.coastlines()
-                ax.set_global()
-            except Exception:
-                pass
-
-            vmin, vmax = da.min().values.item(), da.max().values.item()
-            im = ax.imshow(arr_sorted, origin='lower', 
-                extent=[lon_sorted.min(), lon_sorted.max(), lat.min(), lat.max()],
-                transform=ccrs.PlateCarree(), 
-                vmin=vmin, vmax=vmax)
-
-            long_name = getattr(da, "long_name", var_name)
-            units = getattr(da, "units", "")
-            time_val = da[TIME_NAME].isel({TIME_NAME: t}).values
-            time_str = pd.Timestamp(time_val).strftime("%Y-%m-%d %H:%M UTC")
-            plt.title(f"{var_name} ({long_name}) - t={t} - {time_str}")
-            plt.colorbar(im, ax=ax, orientation="horizontal", pad=0.05, label=f"{units}")
-            fig.subplots_adjust(left=0.05, right=0.95, top=0.90, bottom=0.10)
-
-            buf = io.BytesIO()
-            fig.savefig(buf, format="png", bbox_inches="tight")
-            plt.close(fig)
-            buf.seek(0)
-
-            return buf
+    dataset_dir = dataset_path(dataset)
+    print("dataset dir " + str(dataset_dir))
+    frame = read_frame(dataset, t, lev, var_name)
+    # Keep a coarse copy, so a later re-render (other colour range, evicted
+    # frame) can show a preview without reading anything
+    PREVIEW_CACHE.put(slice_key(dataset, t, lev, var_name), frame["arr"])
+    if vmin is None or vmax is None:
+        # Per-level range for 3D variables; lev is ignored for 2D ones
+        vmin, vmax = STATS_INDEX.limits(dataset_dir, var_name, lev)
+
+    return render_frame(frame, var_name, vmin, vmax)
+
+
+def render_frame(frame: dict, var_name: str, vmin, vmax, cmap=None, fmt="png"):
+    """PNG (or RGBA array with fmt="rgba") of a frame, reusing a figure template.
+
+    The map, coastlines and colour bar are drawn once per grid, variable,
+    colormap and colour range; each frame only swaps the image and title.
+    """
+    key = (frame["arr"].shape, tuple(frame["extent"]), var_name, cmap, vmin, vmax)
+    return FIGURE_TEMPLATES.render(key, lambda: draw_frame(frame, vmin, vmax, cmap),
+                                   frame["arr"], frame["title"], fmt=fmt)
+
@@ -0,0 +1,109 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import matplotlib
+import numpy as np
+from PIL import Image
+
+# Number of (grid, variable, colormap, colour range) templates kept
+TEMPLATE_CACHE_SIZE = int(os.environ.get("TEMPLATE_CACHE_SIZE", 16))
+
+
+class FigureTemplate:
+    """A drawn map figure whose static parts are kept as a pixel background.
+
+    Everything the Axes draws below the image (background, frame) and
+    everything outside the Axes (colour bar, labels) is rendered once. A new
+    frame restores that background, swaps the image array and title, and
+    redraws only the image and the artists stacked above it (coastlines,
+    map outline, title).
+    """
+
+    def __init__(self, fig):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.ax = fig.axes[0]
+        self.im = self.ax.images[0]
+
+        # Same ordering Axes.draw uses; everything from the image up is dynamic
+        artists = [a for a in self.ax.get_children() if a is not self.ax.patch]
+        artists.sort(key=lambda a: a.get_zorder())
+        self.dynamic = artists[artists.index(self.im):]
+
+        visible = [a.get_visible() for a in self.dynamic]
+        for a in self.dynamic:
+            a.set_visible(False)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(fig.bbox)
+        for a, v in zip(self.dynamic, visible):
+            a.set_visible(v)
+        self.canvas.draw()
+
+        # Crop box equivalent to savefig(bbox_inches="tight"), in buffer rows/columns
+        renderer = self.canvas.get_renderer()
+        pad = matplotlib.rcParams["savefig.pad_inches"]
+        bbox = fig.get_tightbbox(renderer).padded(pad)
+        dpi = fig.dpi
+        height = np.asarray(self.canvas.buffer_rgba()).shape[0]
+        top, left = max(0, round(height - bbox.y1 * dpi)), max(0, round(bbox.x0 * dpi))
+        self.crop = (
+            slice(top, top + int(bbox.height * dpi)),
+            slice(left, left + int(bbox.width * dpi)),
+        )
+
+    def rgba(self, arr, title) -> np.ndarray:
+        """Cropped RGBA pixels of the figure with a new image array and title."""
+        self.im.set_data(arr)
+        self.ax.title.set_text(title)
+        self.canvas.restore_region(self.background)
+        for a in self.dynamic:
+            self.ax.draw_artist(a)
+        return np.asarray(self.canvas.buffer_rgba())[self.crop]
+
+    def png(self, arr, title) -> io.BytesIO:
+        buf = io.BytesIO()
+        Image.fromarray(self.rgba(arr, title), "RGBA").save(buf, format="png")
+        buf.seek(0)
+        return buf
+
+
+class TemplateCache:
+    """Idle FigureTemplates per key; each template is used by one thread at a time."""
+
+    def __init__(self, size=TEMPLATE_CACHE_SIZE):
+        self.size = size
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _checkout(self, key, build_figure):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._idle.move_to_end(key)
+                return idle.pop()
+        return FigureTemplate(build_figure())
+
+    def _checkin(self, key, template):
+        with self._lock:
+            self._idle.setdefault(key, []).append(template)
+            self._idle.move_to_end(key)
+            while len(self._idle) > self.size:
+                self._idle.popitem(last=False)
+
+    def render(self, key, build_figure, arr, title, fmt="png"):
+        """Render arr/title on the template for key, building it with build_figure() if needed.
+
+        Returns a PNG BytesIO, or the RGBA array when fmt="rgba".
+        """
+        template = self._checkout(key, build_figure)
+        try:
+            if fmt == "rgba":
+                return template.rgba(arr, title).copy()
+            return template.png(arr, title)
+        finally:
+            self._checkin(key, template)
+
+
+FIGURE_TEMPLATES = TemplateCache()
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# Rendered PNG frames shared by every session in the process. Frames evicted
+# from memory are spilled to FRAME_CACHE_DIR when it is set.
+FRAME_CACHE_MB = float(os.environ.get("FRAME_CACHE_MB", 256))
+FRAME_CACHE_DIR = os.environ.get("FRAME_CACHE_DIR", "")
+FRAME_CACHE_SPILL_MB = float(os.environ.get("FRAME_CACHE_SPILL_MB", 2048))
+
+
+class FrameCache:
+    """Size-bounded LRU of encoded frames with optional on-disk spill.
+
+    Spilled frames are indexed by a digest of their key, and frames already
+    in spill_dir are picked up at startup, so keys made of plain values find
+    their frames again after a restart.
+    """
+
+    def __init__(self, max_bytes=int(FRAME_CACHE_MB * 2**20), spill_dir=FRAME_CACHE_DIR or None,
+                 max_spill_bytes=int(FRAME_CACHE_SPILL_MB * 2**20)):
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.max_spill_bytes = max_spill_bytes
+        self.nbytes = 0
+        self.spill_nbytes = 0
+        self._frames = OrderedDict()
+        self._spilled = OrderedDict()
+        self._lock = threading.Lock()
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._index_spill()
+
+    def _index_spill(self):
+        # Oldest first, so they are the first dropped when over the spill budget
+        files = []
+        for f in self.spill_dir.glob("*.png"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime_ns, f.stem, st.st_size))
+        for _, digest, size in sorted(files):
+            self._spilled[digest] = size
+            self.spill_nbytes += size
+
+    @staticmethod
+    def _digest(key) -> str:
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _spill_file(self, digest) -> Path:
+        return self.spill_dir / (digest + ".png")
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames or self._digest(key) in self._spilled
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def get(self, key) -> bytes | None:
+        with self._lock:
+            data = self._frames.get(key)
+            if data is not None:
+                self._frames.move_to_end(key)
+                return data
+            digest = self._digest(key)
+            size = self._spilled.pop(digest, None)
+            if size is None:
+                return None
+            self.spill_nbytes -= size
+        try:
+            data = self._spill_file(digest).read_bytes()
+            self._spill_file(digest).unlink()
+        except OSError:
+            return None
+        self.put(key, data)
+        return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        spill = []
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self._frames[key] = data
+            self.nbytes += len(data)
+            while self.nbytes > self.max_bytes:
+                old_key, old_data = self._frames.popitem(last=False)
+                self.nbytes -= len(old_data)
+                spill.append((old_key, old_data))
+        if self.spill_dir is not None:
+            for old_key, old_data in spill:
+                self._spill(old_key, old_data)
+
+    def _spill(self, key, data):
+        digest = self._digest(key)
+        try:
+            self._spill_file(digest).write_bytes(data)
+        except OSError as e:
+            print(f"frame cache: spill failed: {e}")
+            return
+        drop = []
+        with self._lock:
+            old = self._spilled.pop(digest, None)
+            if old is not None:
+                self.spill_nbytes -= old
+            self._spilled[digest] = len(data)
+            self.spill_nbytes += len(data)
+            while self.spill_nbytes > self.max_spill_bytes and self._spilled:
+                old_digest, size = self._spilled.popitem(last=False)
+                self.spill_nbytes -= size
+                drop.append(old_digest)
+        for old_digest in drop:
+            self._spill_file(old_digest).unlink(missing_ok=True)
+
+    def clear(self):
+        with self._lock:
+            spilled = list(self._spilled)
+            self._frames.clear()
+            self._spilled.clear()
+            self.nbytes = self.spill_nbytes = 0
+        for digest in spilled:
+            self._spill_file(digest).unlink(missing_ok=True)
+
+
+FRAME_CACHE = FrameCache()
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+
+
+class GridGeometry:
+    """How a run's (lat, lon) grid maps onto a -180..180, south-up image.
+
+    Computed once per grid. For the usual 0..360 longitudes the wrap is a
+    roll, so apply() builds the image from two column blocks of the slice
+    instead of a fancy-indexed gather; lon_order is only kept for grids
+    where sorting is not a roll.
+    """
+
+    def __init__(self, lat_flip: bool, lon_start: int, extent, lon_order=None):
+        self.lat_flip = bool(lat_flip)
+        self.lon_start = int(lon_start)
+        self.extent = [float(e) for e in extent]
+        self.lon_order = None if lon_order is None else np.asarray(lon_order, dtype="intp")
+
+    @classmethod
+    def from_coords(cls, lon, lat):
+        lon = np.asarray(lon, dtype="float64")
+        lat = np.asarray(lat, dtype="float64")
+        lon_wrapped = ((lon + 180.0) % 360.0) - 180.0
+        order = np.argsort(lon_wrapped, kind="stable")
+        start = int(order[0])
+        is_roll = np.array_equal(order, (np.arange(lon.size) + start) % lon.size)
+        extent = [lon_wrapped.min(), lon_wrapped.max(), lat.min(), lat.max()]
+        return cls(lat[0] > lat[-1], start, extent, None if is_roll else order)
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(d["lat_flip"], d["lon_start"], d["extent"], d.get("lon_order"))
+
+    def to_dict(self) -> dict:
+        d = {"lat_flip": self.lat_flip, "lon_start": self.lon_start, "extent": self.extent}
+        if self.lon_order is not None:
+            d["lon_order"] = self.lon_order.tolist()
+        return d
+
+    def apply(self, raw: np.ndarray, fill_threshold=None) -> np.ndarray:
+        """Reordered copy of a 2D (lat, lon) slice, with fill values set to NaN.
+
+        The slice keeps its floating dtype (integers become float32), and
+        this is the only copy made of it.
+        """
+        dtype = np.result_type(raw.dtype, np.float32)
+        rows = slice(None, None, -1) if self.lat_flip else slice(None)
+        if self.lon_order is not None:
+            out = raw[rows][:, self.lon_order].astype(dtype, copy=False)
+        else:
+            out = np.empty(raw.shape, dtype=dtype)
+            k, n = self.lon_start, raw.shape[1]
+            out[:, :n - k] = raw[rows, k:]
+            out[:, n - k:] = raw[rows, :k]
+        if fill_threshold is not None:
+            with np.errstate(invalid="ignore"):
+                out[out > fill_threshold] = np.nan
+        return out
+
+
+# Process-wide geometry per run directory; filled from the metadata scan or on first read
+GRID_GEOMETRY = {}
+_GRID_LOCK = threading.Lock()
+
+
+def register_grid(path, geometry: GridGeometry):
+    with _GRID_LOCK:
+        GRID_GEOMETRY[str(path)] = geometry
+
+
+def grid_for(path, ds, lon_name, lat_name) -> GridGeometry:
+    """Cached geometry of a run, computed from the open dataset's coordinates when missing."""
+    with _GRID_LOCK:
+        geometry = GRID_GEOMETRY.get(str(path))
+    if geometry is None:
+        geometry = GridGeometry.from_coords(ds[lon_name].values, ds[lat_name].values)
+        register_grid(path, geometry)
+    return geometry
+
+
+class PointIndex:
+    """Nearest grid cell to a (lat, lon) point, as indices into the file's own lat/lon axes."""
+
+    def __init__(self, lon, lat):
+        lat = np.asarray(lat, dtype="float64")
+        lon = ((np.asarray(lon, dtype="float64") + 180.0) % 360.0) - 180.0
+        self._lat_order = np.argsort(lat)
+        self._lat_sorted = lat[self._lat_order]
+        self._lon_order = np.argsort(lon)
+        self._lon_sorted = lon[self._lon_order]
+
+    @staticmethod
+    def _nearest(values, x, period=None):
+        pos = int(np.searchsorted(values, x))
+        candidates = {max(0, pos - 1), min(len(values) - 1, pos)}
+        if period is not None:
+            # The first and last longitudes are neighbours across the date line
+            candidates |= {0, len(values) - 1}
+
+        def distance(k):
+            d = abs(values[k] - x)
+            return min(d, period - d) if period is not None else d
+        return min(candidates, key=distance)
+
+    def nearest(self, lat, lon) -> tuple[int, int]:
+        """(lat index, lon index) of the cell closest to the point."""
+        lon = ((lon + 180.0) % 360.0) - 180.0
+        j = self._lat_order[self._nearest(self._lat_sorted, lat)]
+        i = self._lon_order[self._nearest(self._lon_sorted, lon, period=360.0)]
+        return int(j), int(i)
+
+
+POINT_INDEX = {}
+
+
+def point_index_for(path, ds, lon_name, lat_name) -> PointIndex:
+    """Cached PointIndex of a run, built from the open dataset's coordinates when missing."""
+    with _GRID_LOCK:
+        index = POINT_INDEX.get(str(path))
+    if index is None:
+        index = PointIndex(ds[lon_name].values, ds[lat_name].values)
+        with _GRID_LOCK:
+            POINT_INDEX[str(path)] = index
+    return index
@@ -0,0 +1,219 @@
+import itertools
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from datasetPool import CACHE_DIR
+
+# Commands run at once; the rest wait in the queue
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Output lines kept in memory per job
+JOB_BUFFER_LINES = int(os.environ.get("JOB_BUFFER_LINES", 5000))
+# Full output of every job, one file per job
+JOB_LOG_DIR = Path(os.environ.get("JOB_LOG_DIR", CACHE_DIR / "jobs"))
+# Seconds a cancelled job gets to exit after SIGTERM before it is killed
+JOB_KILL_TIMEOUT = float(os.environ.get("JOB_KILL_TIMEOUT", 10.0))
+
+QUEUED, RUNNING, FINISHED, FAILED, CANCELLED = "queued", "running", "finished", "failed", "cancelled"
+
+
+class Job:
+    """One shell command with its status and the tail of its output.
+
+    Output lines (stdout and stderr, interleaved as written) go into a
+    ring buffer of buffer_lines; seq counts every line ever written, so a
+    reader can ask for what arrived since its last look. The whole output
+    is also written to log_path, which search() and downloads read from.
+    """
+
+    def __init__(self, job_id: int, command: str, cwd=None, env=None, buffer_lines=JOB_BUFFER_LINES,
+                 log_path=None):
+        self.id = job_id
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.status = QUEUED
+        self.returncode = None
+        self.submitted = time.time()
+        self.started = None
+        self.ended = None
+        self.seq = 0
+        self.log_path = log_path
+        self._log = None
+        self._lines = deque(maxlen=buffer_lines)
+        self._lock = threading.Lock()
+        self._process = None
+        self._cancelled = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (FINISHED, FAILED, CANCELLED)
+
+    def append(self, line: str):
+        with self._lock:
+            self._lines.append(line)
+            self.seq += 1
+            if self._log is not None:
+                self._log.write(line + "\n")
+
+    def lines_since(self, seq: int = 0):
+        """(current seq, lines written after seq); lines already dropped from the buffer are skipped."""
+        with self._lock:
+            new = min(self.seq - seq, len(self._lines))
+            if new <= 0:
+                return self.seq, []
+            return self.seq, list(itertools.islice(self._lines, len(self._lines) - new, None))
+
+    def search(self, text: str, limit: int = 200) -> list:
+        """(line number, line) pairs of the full log containing text, case-insensitive, at most limit."""
+        text = text.lower()
+        matches = []
+        if self.log_path is None or not Path(self.log_path).exists():
+            return matches
+        with open(self.log_path, errors="replace") as f:
+            for number, line in enumerate(f, 1):
+                if text in line.lower():
+                    matches.append((number, line.rstrip("\n")))
+                    if len(matches) >= limit:
+                        break
+        return matches
+
+    def summary(self) -> dict:
+        end = self.ended or time.time()
+        return {
+            "id": self.id,
+            "status": self.status,
+            "exit": self.returncode,
+            "runtime": round(end - self.started, 1) if self.started else None,
+            "command": self.command,
+        }
+
+
+class JobQueue:
+    """Runs shell commands in background threads, at most workers at a time.
+
+    submit() returns at once; each job streams its output line by line into
+    its Job. Subscribers are called from the worker threads with the job
+    whenever its status changes, so UI code must hop back onto its own
+    event loop before touching widgets.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, buffer_lines=JOB_BUFFER_LINES, log_dir=JOB_LOG_DIR):
+        self.buffer_lines = buffer_lines
+        self.log_dir = Path(log_dir)
+        # Part of each log name, so a restarted server does not overwrite earlier logs
+        self._stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def _notify(self, job):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(job)
+            except Exception as e:
+                print(f"jobs: subscriber failed: {e}")
+
+    def submit(self, command: str, cwd=None, env=None) -> Job:
+        job_id = next(self._ids)
+        job = Job(job_id, command, cwd, env, self.buffer_lines,
+                  self.log_dir / f"job-{self._stamp}-{job_id}.log")
+        with self._lock:
+            self.jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        self._notify(job)
+        return job
+
+    def _run(self, job):
+        try:
+            with job._lock:
+                if job._cancelled.is_set():
+                    return
+                self.log_dir.mkdir(parents=True, exist_ok=True)
+                job._log = open(job.log_path, "w", buffering=1)
+                # Own process group, so cancelling also stops whatever the shell started
+                job._process = subprocess.Popen(
+                    job.command, shell=True, cwd=job.cwd,
+                    env=None if job.env is None else {**os.environ, **job.env},
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    text=True, bufsize=1, errors="replace", start_new_session=True)
+                job.status, job.started = RUNNING, time.time()
+            self._notify(job)
+            for line in job._process.stdout:
+                job.append(line.rstrip("\n"))
+            job.returncode = job._process.wait()
+            if job._cancelled.is_set():
+                job.status = CANCELLED
+            else:
+                job.status = FINISHED if job.returncode == 0 else FAILED
+        except Exception as e:
+            job.append(str(e))
+            job.status = FAILED
+        finally:
+            with job._lock:
+                if job._log is not None:
+                    job._log.close()
+                    job._log = None
+        job.ended = time.time()
+        self._notify(job)
+
+    def cancel(self, job_id: int) -> bool:
+        """Drop a queued job, or terminate a running one (killed after JOB_KILL_TIMEOUT)."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        with job._lock:
+            job._cancelled.set()
+            process = job._process
+        if process is None:
+            job.status, job.ended = CANCELLED, time.time()
+            self._notify(job)
+            return True
+
+        def kill(sig):
+            # The group may already be gone; _run records the exit either way
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                pass
+
+        def stop():
+            kill(signal.SIGTERM)
+            try:
+                process.wait(JOB_KILL_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                kill(signal.SIGKILL)
+        threading.Thread(target=stop, name=f"job-{job_id}-cancel", daemon=True).start()
+        return True
+
+    def all_jobs(self) -> list:
+        """Every job in submission order; copied under the lock, as submit() may be adding one."""
+        with self._lock:
+            return list(self.jobs.values())
+
+    def active(self) -> list:
+        return [job for job in self.all_jobs() if not job.done]
+
+
+# Shared by every session, so jobs keep running when a browser tab closes
+JOB_QUEUE = JobQueue()
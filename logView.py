@@ -0,0 +1,128 @@
+import asyncio
+import html
+import os
+from pathlib import Path
+
+import panel as pn
+import param
+
+# Characters of output a newly opened browser view starts with
+LOG_TAIL_CHARS = int(os.environ.get("LOG_TAIL_CHARS", 200_000))
+# Lines the browser terminal keeps for scrolling back
+LOG_SCROLLBACK = int(os.environ.get("LOG_SCROLLBACK", 5000))
+# Search results listed at most
+LOG_SEARCH_LIMIT = int(os.environ.get("LOG_SEARCH_LIMIT", 200))
+
+
+class TailTerminal(pn.widgets.Terminal):
+    """Terminal whose server-side output holds only the last tail_chars.
+
+    write() still sends just the new text to the browser; the kept tail is
+    what a view opened later (e.g. after a reload) starts from.
+    """
+
+    tail_chars = param.Integer(default=LOG_TAIL_CHARS)
+
+    def write(self, s):
+        n = super().write(s)
+        if len(self.output) > self.tail_chars:
+            # Keep whole lines
+            tail = self.output[-self.tail_chars:]
+            self.output = tail[tail.find("\n") + 1:]
+        return n
+
+
+class LogView(param.Parameterized):
+    """Console for one job at a time, fed only the lines that are new.
+
+    The browser gets deltas, the server keeps a bounded tail and the full
+    log stays in the job's file on disk, which the search box and the
+    download button read.
+    """
+
+    search_text = param.String(default="")
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self._job = None
+        self._seq = 0
+        self.header = pn.pane.Markdown("", sizing_mode="stretch_width", margin=(0, 5))
+        self.terminal = TailTerminal(
+            options={"convertEol": True, "scrollback": LOG_SCROLLBACK, "disableStdin": True},
+            height=400,
+            sizing_mode="stretch_width"
+        )
+        self.search_input = pn.widgets.TextInput(name="", placeholder="Search the full log...",
+                                                 sizing_mode="stretch_width")
+        self.search_input.link(self, value="search_text")
+        self.results = pn.pane.HTML("", sizing_mode="stretch_width", max_height=300,
+                                    styles={"overflow-y": "auto"})
+        self.download = pn.widgets.FileDownload(callback=self._open_log, filename="job.log",
+                                                label="Download log", button_type="light",
+                                                disabled=True, width=140)
+
+    def show(self, job):
+        """Switch to a job: reset the terminal to its in-memory tail."""
+        self._job = job
+        self._seq = 0
+        self.terminal.clear()
+        self.results.object = ""
+        self.download.disabled = job is None
+        if job is not None:
+            self.download.filename = Path(job.log_path).name if job.log_path else f"job-{job.id}.log"
+        self.update()
+
+    def update(self):
+        """Write whatever the job printed since the last call."""
+        job = self._job
+        if job is None:
+            self.header.object = ""
+            return
+        seq, lines = job.lines_since(self._seq)
+        skipped = seq - self._seq - len(lines)
+        self._seq = seq
+        if skipped:
+            lines = [f"... {skipped} earlier lines not shown, search or download the log ..."] + lines
+        if lines:
+            self.terminal.write("\n".join(lines) + "\n")
+        header = f"**job {job.id}** `{job.command}` - {job.status}"
+        if job.returncode is not None:
+            header += f" (exit {job.returncode})"
+        if header != self.header.object:
+            self.header.object = header
+
+    @param.depends("search_text", watch=True)
+    def _on_search(self):
+        pn.state.execute(self._search)
+
+    async def _search(self):
+        # The log can be large; scan it off the event loop
+        job, text = self._job, self.search_text.strip()
+        if job is None or not text:
+            self.results.object = ""
+            return
+        loop = asyncio.get_running_loop()
+        matches = await loop.run_in_executor(None, job.search, text, LOG_SEARCH_LIMIT)
+        if job is not self._job or text != self.search_text.strip():
+            # Superseded while scanning
+            return
+        if not matches:
+            self.results.object = "<i>No matches</i>"
+            return
+        rows = "\n".join(f"{number:>7}  {html.escape(line)}" for number, line in matches)
+        more = f"\n(first {LOG_SEARCH_LIMIT} matches)" if len(matches) >= LOG_SEARCH_LIMIT else ""
+        self.results.object = f"<pre style='background:#f4f4f4; padding:5px; margin:0'>{rows}{more}</pre>"
+
+    def _open_log(self):
+        if self._job is None or self._job.log_path is None:
+            return None
+        return str(self._job.log_path)
+
+    def panel(self):
+        return pn.Column(
+            self.header,
+            self.terminal,
+            pn.Row(self.search_input, self.download, sizing_mode="stretch_width"),
+            self.results,
+            sizing_mode="stretch_width"
+        )
@@ -22,36 +22,29 @@
 
 import xarray as xr
 from pathlib import Path
-from era5_plot import plot_png, NETCDF_FILE, VAR_NAME, TIME_NAME, LEV_NAME, PRES_NAME, LAT_NAME, LON_NAME
+from era5_plot import plot_png, STATS_INDEX, NETCDF_FILE, VAR_NAME, TIME_NAME, LEV_NAME, PRES_NAME, LAT_NAME, LON_NAME
+from datasetScan import DATASET_METADATA, scan_once
+from datasetWatcher import get_watcher
 import panel as pn
 import param
 
 from datasetSelector2 import DatasetBrowser
 from metadata import DatasetMetadata
-from datasetPlot import DatasetPlot2
+from plotGrid import PlotGrid
 from commandRunner import CommandRunner
+from renderEngine import RENDER_WORKERS
 
-pn.extension(raw_css=[Path("static/styles.css").read_text()])
+# nthreads lets callbacks from different sessions run at the same time
+pn.extension(raw_css=[Path("static/styles.css").read_text()], nthreads=RENDER_WORKERS)
 
 DATA_DIR = Path("/Users/vapor/Data/model_predict")
-DATASET_METADATA = {}
 
 def scan_datasets():
-    for d in DATA_DIR.iterdir():
-        if d.is_dir():
-            nc_file = f"{d}/*.nc"
-            with xr.open_mfdataset(nc_file, engine="netcdf4", autoclose=True) as ds:
-                DATASET_METADATA[d.name] = {
-                    "ntime": len(ds.time),
-                    "nlev": len(ds.get(LEV_NAME, [])),
-                    "nplev": int(ds.sizes[PRES_NAME]),
-                    "nlat": int(ds.sizes[LAT_NAME]),
-                    "nlon": int(ds.sizes[LON_NAME]),
-                    "stime": str(ds.time.values[0].astype("datetime64[s]")),
-                    "etime": str(ds.time.values[-1].astype("datetime64[s]")),
-                    "vars2d": [v for v in ds.data_vars if len(ds[v].dims) <= 3],
-                    "vars3d": [v for v in ds.data_vars if len(ds[v].dims) > 3]
-                }
+    # Concurrent, header-only scan, once per server process (this file runs
+    # for every session); unchanged runs come from the on-disk cache
+    if scan_once(DATA_DIR, DATASET_METADATA):
+        # Colour statistics read every file, so they are built behind the first frames
+        STATS_INDEX.build(DATA_DIR / name for name in sorted(DATASET_METADATA))
 
 scan_datasets()
 
@@ -61,35 +54,36 @@ def available_datasets():
         if d.is_dir()
     )
 
-browser = DatasetBrowser(datasets=available_datasets())
+browser = DatasetBrowser(datasets=available_datasets(), metadata=DATASET_METADATA)
 
-@pn.depends(browser.param.checked_items)
-def plot_grid(datasets):
-
-    if not datasets:
-        return pn.pane.Markdown("### Select one or more datasets")
-
-    plots = [
-        DatasetPlot2(dataset=ds, metadata=DATASET_METADATA).panel()
-        for ds in datasets
-    ]
-
-    return pn.GridBox(
-        *plots,
-        ncols=2,
-        sizing_mode=None,
-        css_classes=["plot-grid"],
-        styles={
-            "grid-auto-rows": "min-content",
-            "align-items": "start"
-        },
-    )
+# Plots are added/removed per checkbox instead of rebuilding the whole grid
+plot_grid = PlotGrid(metadata=DATASET_METADATA)
+browser.param.watch(lambda event: setattr(plot_grid, "datasets", list(event.new)), 'checked_items')
 
 metadata = DatasetMetadata(metadata=DATASET_METADATA)
 def sync_active_dataset(event):
     metadata.active_key = event.new
 browser.param.watch(sync_active_dataset, 'active_dataset')
 
+# Pick up runs written after startup. The watcher thread scans them; the
+# widget updates are scheduled on this session's event loop.
+watcher = get_watcher(DATA_DIR)
+session_doc = pn.state.curdoc
+
+def apply_dataset_changes():
+    browser.update_datasets(available_datasets())
+    metadata.param.trigger('metadata')
+    plot_grid.update()
+
+def on_datasets_changed(added, changed, removed):
+    if session_doc is not None and session_doc.session_context is not None:
+        session_doc.add_next_tick_callback(apply_dataset_changes)
+    else:
+        apply_dataset_changes()
+
+watcher.subscribe(on_datasets_changed)
+pn.state.on_session_destroyed(lambda session_context: watcher.unsubscribe(on_datasets_changed))
+
 sidebar = pn.Column(
     "## Datasets",
     browser.panel,
@@ -98,7 +92,7 @@ sidebar = pn.Column(
 )
 
 main = pn.Column(
-    plot_grid,
+    plot_grid.view,
     sizing_mode="stretch_width",
     css_classes=["main-content"]    
 )
@@ -120,3 +114,11 @@ tabs = pn.Tabs(
     ("Visualization", vis),
     ("Inference", inference)
 ).servable()
+
+# Plots on a hidden tab do no rendering or prefetching
+def pause_hidden_plots(event):
+    if event.new == 0:
+        plot_grid.resume_all()
+    else:
+        plot_grid.pause_all()
+tabs.param.watch(pause_hidden_plots, 'active')
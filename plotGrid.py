@@ -0,0 +1,204 @@
+import asyncio
+import os
+from collections import OrderedDict
+from functools import partial
+
+import panel as pn
+import param
+
+from datasetPlot import DatasetPlot2
+from era5_plot import dataset_path, STATS_INDEX
+
+# Unchecked plots kept (paused) so re-checking a dataset restores its state
+PLOT_GRID_HIDDEN = int(os.environ.get("PLOT_GRID_HIDDEN", 8))
+
+
+class PlotGrid(param.Parameterized):
+    """GridBox of DatasetPlot2 panels kept in step with a list of dataset names.
+
+    update() adds panels only for newly selected datasets and removes only
+    the deselected ones; the plots that stay keep their widgets, slider
+    positions and rendered frames. Removed plots are paused and kept for a
+    while, so ticking a dataset again brings it back as it was.
+
+    With linked=True one variable/time/level control drives every plot and
+    all of them share a colour scale, the envelope of the runs' stored
+    statistics. That envelope is worked out in a worker thread once per
+    set of runs, variable and (for 3D variables) level; until it is ready
+    the linked controls wait rather than render with each run's own range.
+    The plots render concurrently through the render engine.
+    """
+
+    datasets = param.List(default=[])
+    linked = param.Boolean(default=False)
+
+    def __init__(self, metadata, hidden=PLOT_GRID_HIDDEN, **params):
+        super().__init__(**params)
+        self.metadata = metadata
+        self.hidden = hidden
+        self._plots = {}
+        self._hidden = OrderedDict()
+        self._placeholder = pn.pane.Markdown("### Select one or more datasets")
+        self.grid = pn.GridBox(
+            ncols=2,
+            sizing_mode=None,
+            css_classes=["plot-grid"],
+            styles={
+                "grid-auto-rows": "min-content",
+                "align-items": "start"
+            },
+        )
+
+        # Comparison controls, shown once two or more datasets are selected
+        self.link_toggle = pn.widgets.Toggle(name="Link plots", value=False, width=100, align="center")
+        self.link_toggle.link(self, value="linked")
+        self.shared_var = pn.widgets.Select(name="", options=[], width=120, align="center")
+        self.shared_time = pn.widgets.IntSlider(name="Time", start=0, end=1, value=0,
+                                                sizing_mode="stretch_width")
+        self.shared_level = pn.widgets.IntSlider(name="Level", start=0, end=1, value=0,
+                                                 sizing_mode="stretch_width")
+        for widget in (self.shared_var, self.shared_time, self.shared_level):
+            widget.param.watch(lambda event: self._apply_shared(), "value")
+        for widget in (self.shared_time, self.shared_level):
+            widget.param.watch(lambda event: self._apply_shared(final=True), "value_throttled")
+        self.controls = pn.Row(
+            self.link_toggle,
+            self.shared_var,
+            self.shared_time,
+            self.shared_level,
+            visible=False,
+            align="center",
+            sizing_mode="stretch_width",
+            css_classes=["widget-row"]
+        )
+        self._updating = False
+        # Shared colour limits per (run directories, variable, level), and the keys being computed
+        self._limits = {}
+        self._loading = set()
+
+        self.view = pn.Column(self.controls, self._placeholder, sizing_mode="stretch_width")
+
+    def _show(self, name):
+        entry = self._hidden.pop(name, None)
+        if entry is not None:
+            entry[0].resume()
+            return entry
+        plot = DatasetPlot2(dataset=name, metadata=self.metadata)
+        return plot, plot.panel()
+
+    def _hide(self, name):
+        entry = self._plots.pop(name)
+        entry[0].pause()
+        self._hidden[name] = entry
+        while len(self._hidden) > self.hidden:
+            self._hidden.popitem(last=False)
+
+    @param.depends("datasets", watch=True)
+    def update(self):
+        names = [n for n in self.datasets if n in self.metadata]
+        for name in list(self._plots):
+            if name not in names:
+                self._hide(name)
+        for name in names:
+            if name not in self._plots:
+                self._plots[name] = self._show(name)
+        # Runs that disappeared from disk are not worth keeping
+        for name in [n for n in self._hidden if n not in self.metadata]:
+            del self._hidden[name]
+
+        for name, (plot, _) in self._plots.items():
+            plot.refresh_metadata(self.metadata[name])
+            plot.ensemble = names
+
+        objects = [self._plots[name][1] for name in names]
+        if objects != list(self.grid.objects):
+            self.grid.objects = objects
+        content = self.grid if objects else self._placeholder
+        if self.view.objects[1] is not content:
+            self.view[1] = content
+
+        self.controls.visible = len(names) > 1
+        # Runs may have gained steps (and statistics) since the limits were computed
+        self._limits.clear()
+        if self.linked:
+            self._update_shared_controls()
+            self._apply_shared(final=True)
+
+    def _linked_plots(self):
+        return [plot for plot, _ in self._plots.values()]
+
+    def _update_shared_controls(self, start=None):
+        """Limit the shared controls to what every selected run has; optionally take start's position."""
+        plots = self._linked_plots()
+        if not plots:
+            return
+        self._updating = True
+        try:
+            common = [v for v in plots[0].metadata["vars2d"] + plots[0].metadata["vars3d"]
+                      if all(v in p.metadata["vars2d"] + p.metadata["vars3d"] for p in plots)]
+            self.shared_var.options = common
+            if start is not None and start.var_name in common:
+                self.shared_var.value = start.var_name
+            elif self.shared_var.value not in common and common:
+                self.shared_var.value = common[0]
+            self.shared_time.end = max(1, min(p.time_slider.end for p in plots))
+            self.shared_level.end = max(1, min(p.level_slider.end for p in plots))
+            if start is not None:
+                self.shared_time.value = min(start.time_index, self.shared_time.end)
+                self.shared_level.value = min(start.level_index, self.shared_level.end)
+        finally:
+            self._updating = False
+
+    def _apply_shared(self, final=False):
+        if not self.linked or self._updating or not self.shared_var.value:
+            return
+        var_name = self.shared_var.value
+        plots = self._linked_plots()
+        if not plots:
+            return
+        # Per-level limits for 3D variables; 2D ones share one entry across levels
+        lev = self.shared_level.value if var_name in plots[0].metadata["vars3d"] else None
+        key = (tuple(str(dataset_path(p.dataset)) for p in plots), var_name, lev)
+        limits = self._limits.get(key)
+        if limits is None:
+            # Applied once the limits are in; slider moves meanwhile are picked up then
+            if key not in self._loading:
+                self._loading.add(key)
+                pn.state.execute(partial(self._load_limits, key))
+            return
+        for plot in plots:
+            plot.set_view(var_name, self.shared_time.value, self.shared_level.value,
+                          color_limits=limits, final=final)
+
+    async def _load_limits(self, key):
+        # Reads the variable directly for runs that are not indexed yet
+        dirs, var_name, lev = key
+        loop = asyncio.get_running_loop()
+        try:
+            self._limits[key] = await loop.run_in_executor(None, STATS_INDEX.shared_limits,
+                                                           list(dirs), var_name, lev)
+        except Exception as e:
+            print(f"plot grid: no shared limits for {var_name}: {e}")
+            return
+        finally:
+            self._loading.discard(key)
+        self._apply_shared(final=True)
+
+    @param.depends("linked", watch=True)
+    def _toggle_linked(self):
+        plots = self._linked_plots()
+        if self.linked:
+            # Start from where the first plot is
+            self._update_shared_controls(start=plots[0] if plots else None)
+            self._apply_shared(final=True)
+        else:
+            for plot in plots:
+                plot.color_limits = None
+
+    def pause_all(self):
+        for plot, _ in self._plots.values():
+            plot.pause()
+
+    def resume_all(self):
+        for plot, _ in self._plots.values():
+            plot.resume()
@@ -0,0 +1,81 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from datasetPool import DATASET_POOL
+from era5_plot import (dataset_path, FILL_THRESHOLD, TIME_NAME, LEV_NAME, PRES_NAME,
+                       LAT_NAME, LON_NAME)
+from gridGeometry import point_index_for
+
+# Probe results kept per (run files, variable, cell, level/time)
+PROBE_CACHE_SIZE = int(os.environ.get("PROBE_CACHE_SIZE", 64))
+
+_PROBES = OrderedDict()
+_PROBES_LOCK = threading.Lock()
+
+
+def _level_dim(da):
+    return next((d for d in (LEV_NAME, PRES_NAME) if d in da.dims), None)
+
+
+def _read_point(dataset, var_name, lat, lon, indexers, kind):
+    # One isel over the whole remaining axis (time or level) at a single cell
+    path = dataset_path(dataset)
+    with DATASET_POOL.acquire(path) as ds:
+        if var_name not in ds.data_vars:
+            raise ValueError(f"Variable '{var_name}' not found in dataset")
+        da = ds[var_name]
+        j, i = point_index_for(path, ds, LON_NAME, LAT_NAME).nearest(lat, lon)
+        indexers = {d: v for d, v in indexers.items() if d in da.dims}
+        if TIME_NAME in indexers:
+            indexers[TIME_NAME] = int(np.clip(indexers[TIME_NAME], 0, da.sizes[TIME_NAME] - 1))
+        indexers.update({LAT_NAME: j, LON_NAME: i})
+        point = da.isel(indexers)
+        values = point.values.astype("float64")
+        values[values > FILL_THRESHOLD] = np.nan
+        axis_dim = TIME_NAME if kind == "series" else _level_dim(da)
+        return {
+            "x": point[axis_dim].values if axis_dim else np.array([]),
+            "values": values,
+            "lat": float(ds[LAT_NAME].values[j]),
+            "lon": float(((ds[LON_NAME].values[i] + 180.0) % 360.0) - 180.0),
+            "units": getattr(da, "units", ""),
+            "dim": axis_dim,
+        }
+
+
+def _cached(key, read):
+    with _PROBES_LOCK:
+        result = _PROBES.get(key)
+        if result is not None:
+            _PROBES.move_to_end(key)
+            return result
+    result = read()
+    with _PROBES_LOCK:
+        _PROBES[key] = result
+        while len(_PROBES) > PROBE_CACHE_SIZE:
+            _PROBES.popitem(last=False)
+    return result
+
+
+def probe_series(dataset: str, var_name: str, lat: float, lon: float, lev: int = 0) -> dict:
+    """Whole time series of a variable at the grid cell nearest (lat, lon), at one level.
+
+    Returns x (times), values, the cell's lat/lon and units.
+    """
+    key = ("series", str(dataset_path(dataset)), DATASET_POOL.digest(dataset_path(dataset)),
+           var_name, round(lat, 4), round(lon, 4), lev)
+    return _cached(key, lambda: _read_point(dataset, var_name, lat, lon,
+                                            {LEV_NAME: lev, PRES_NAME: lev}, "series"))
+
+
+def probe_profile(dataset: str, var_name: str, lat: float, lon: float, t: int) -> dict:
+    """Vertical column of a 3D variable at the grid cell nearest (lat, lon), at one time step.
+
+    x holds the level coordinate; it is empty for 2D variables.
+    """
+    key = ("profile", str(dataset_path(dataset)), DATASET_POOL.digest(dataset_path(dataset)),
+           var_name, round(lat, 4), round(lon, 4), t)
+    return _cached(key, lambda: _read_point(dataset, var_name, lat, lon, {TIME_NAME: t}, "profile"))
@@ -0,0 +1,170 @@
+import io
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.image import imsave
+
+from datasetPool import cache_path, fingerprint_digest
+
+# Longest side (grid cells) of the coarse copies kept for previews; 0 disables previews
+PREVIEW_CELLS = int(os.environ.get("PREVIEW_CELLS", 256))
+# Coarse slices kept in memory (each at most PREVIEW_CELLS^2 float32 values)
+PREVIEW_CACHE_SIZE = int(os.environ.get("PREVIEW_CACHE_SIZE", 128))
+# Per-run directory under CACHE_DIR with the coarse copy of every slice
+PREVIEW_DIR = "previews"
+
+
+def block_mean(arr):
+    """2x2 NaN-aware block mean; odd edges are padded with NaN."""
+    ny, nx = arr.shape
+    if ny % 2 or nx % 2:
+        padded = np.full((ny + ny % 2, nx + nx % 2), np.nan, dtype=arr.dtype)
+        padded[:ny, :nx] = arr
+        arr = padded
+    blocks = arr.reshape(arr.shape[0] // 2, 2, arr.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (total / count).astype(arr.dtype)
+
+
+def coarsen(arr, max_cells: int):
+    """arr block-averaged by 2x steps until its longest side is at most max_cells."""
+    arr = np.asarray(arr, dtype="float32")
+    while max(arr.shape) > max_cells and min(arr.shape) > 1:
+        arr = block_mean(arr)
+    return arr
+
+
+class PreviewCache:
+    """Coarse copies of slices that were read at full resolution, for instant previews.
+
+    put() is called with a slice already in memory, so a preview never
+    costs a read; png() encodes the coarse copy as a small bare image.
+    """
+
+    def __init__(self, max_cells=PREVIEW_CELLS, max_items=PREVIEW_CACHE_SIZE):
+        self.max_cells = max_cells
+        self.max_items = max_items
+        self._slices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._slices
+
+    def put(self, key, arr):
+        if self.max_cells <= 0 or self.max_items <= 0:
+            return
+        with self._lock:
+            if key in self._slices:
+                self._slices.move_to_end(key)
+                return
+        coarse = coarsen(arr, self.max_cells)
+        with self._lock:
+            self._slices[key] = coarse
+            while len(self._slices) > self.max_items:
+                self._slices.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            arr = self._slices.get(key)
+            if arr is not None:
+                self._slices.move_to_end(key)
+            return arr
+
+    def png(self, key, vmin, vmax, cmap=None) -> bytes | None:
+        """Small PNG of the coarse slice (south up, no map decorations), or None when not cached."""
+        arr = self.get(key)
+        if arr is None:
+            return None
+        buf = io.BytesIO()
+        imsave(buf, arr, vmin=vmin, vmax=vmax, cmap=colormaps[cmap or "viridis"], origin="lower",
+               format="png")
+        return buf.getvalue()
+
+
+class PreviewStore:
+    """Coarse copies of every slice of a run, on disk under CACHE_DIR.
+
+    write() is called by the colour statistics pass with each NetCDF file
+    it has just read, so the store costs no extra read. Each file gets one
+    .npy per variable, (time[, level], lat, lon) at most max_cells on the
+    longest side and oriented like a frame; read() memory-maps it and
+    copies out one slice. Files are stored under a digest of their
+    (mtime, size) stamp, so a rewritten file is never previewed from its
+    old copy.
+    """
+
+    def __init__(self, time_dim="time", level_dims=("level",), lat_dim="latitude",
+                 lon_dim="longitude", fill_threshold=1.0e20, max_cells=PREVIEW_CELLS):
+        self.time_dim = time_dim
+        self.level_dims = tuple(level_dims)
+        self.lat_dim = lat_dim
+        self.lon_dim = lon_dim
+        self.fill_threshold = fill_threshold
+        self.max_cells = max_cells
+        # (run, fingerprint digest) -> time steps per file, read from the .npy headers
+        self._steps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _file_dir(self, dataset_dir, name, stamp):
+        return cache_path(dataset_dir, PREVIEW_DIR) / name / fingerprint_digest([stamp])
+
+    def write(self, dataset_dir, name, stamp, ds, grid):
+        """Store the coarse slices of one open file; grid is the run's GridGeometry."""
+        if self.max_cells <= 0:
+            return
+        out = self._file_dir(dataset_dir, name, stamp)
+        # The file's whole directory is swapped, which also drops copies of earlier versions
+        tmp_parent = out.parent.with_name(out.parent.name + ".tmp")
+        tmp = tmp_parent / out.name
+        try:
+            shutil.rmtree(tmp_parent, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            for var_name, da in ds.data_vars.items():
+                if not np.issubdtype(da.dtype, np.number) or \
+                        da.dims[:1] != (self.time_dim,) or da.dims[-2:] != (self.lat_dim, self.lon_dim):
+                    continue
+                # (time, level) pairs, or (time,) alone, each one 2D slice
+                values = da.values
+                lead = values.shape[:-2]
+                slices = [coarsen(grid.apply(values[i], self.fill_threshold), self.max_cells)
+                          for i in np.ndindex(lead)]
+                np.save(tmp / f"{var_name}.npy", np.stack(slices).reshape(lead + slices[0].shape))
+            shutil.rmtree(out.parent, ignore_errors=True)
+            os.replace(tmp_parent, out.parent)
+        except OSError as e:
+            print(f"previews: could not write {out}: {e}")
+            shutil.rmtree(tmp_parent, ignore_errors=True)
+
+    def read(self, dataset_dir, fingerprint, var_name, t, lev=0):
+        """Coarse copy of one slice, or None when the run's current files are not all stored yet."""
+        key = (str(dataset_dir), fingerprint_digest(fingerprint))
+        with self._lock:
+            steps = self._steps.get(key)
+        paths = [self._file_dir(dataset_dir, name, [mtime, size]) / f"{var_name}.npy"
+                 for name, mtime, size in fingerprint]
+        try:
+            if steps is None:
+                steps = [np.load(path, mmap_mode="r").shape[0] for path in paths]
+                with self._lock:
+                    self._steps[key] = steps
+                    while len(self._steps) > PREVIEW_CACHE_SIZE:
+                        self._steps.popitem(last=False)
+            for path, n in zip(paths, steps):
+                if t < n:
+                    arr = np.load(path, mmap_mode="r")[t]
+                    return np.array(arr[lev] if arr.ndim == 3 else arr)
+                t -= n
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+
+PREVIEW_CACHE = PreviewCache()
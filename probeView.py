@@ -0,0 +1,57 @@
+import numpy as np
+import panel as pn
+from bokeh.models import ColumnDataSource, Span
+from bokeh.plotting import figure
+
+
+class ProbeView:
+    """Side pane with the time series and vertical profile at a probed point.
+
+    Both Bokeh figures are built once; update() only replaces their data.
+    """
+
+    def __init__(self, width=320, height=200):
+        self.series_source = ColumnDataSource(data={"x": [], "y": []})
+        self.series = figure(width=width, height=height, x_axis_type="datetime",
+                             tools="pan,wheel_zoom,reset,save", title="")
+        self.series.line("x", "y", source=self.series_source, line_width=1.5)
+        self.series.scatter("x", "y", source=self.series_source, size=3)
+        # Marks the time step shown on the map
+        self.cursor = Span(dimension="height", line_color="firebrick", line_dash="dashed",
+                           location=None)
+        self.series.add_layout(self.cursor)
+
+        self.profile_source = ColumnDataSource(data={"x": [], "y": []})
+        self.profile = figure(width=width, height=height,
+                              tools="pan,wheel_zoom,reset,save", title="")
+        self.profile.line("x", "y", source=self.profile_source, line_width=1.5)
+        self.profile.scatter("x", "y", source=self.profile_source, size=4)
+        self.profile.yaxis.axis_label = "level"
+
+        self.profile_pane = pn.pane.Bokeh(self.profile, visible=False)
+        self.pane = pn.Column(
+            pn.pane.Bokeh(self.series),
+            self.profile_pane,
+            visible=False,
+            margin=(0, 0, 0, 10),
+        )
+
+    def update(self, var_name, series: dict, profile: dict = None, t_index: int = None):
+        """Show probe_series (and probe_profile for 3D variables) results."""
+        where = f"{series['lat']:.2f}°, {series['lon']:.2f}°"
+        self.series_source.data = {"x": series["x"], "y": series["values"]}
+        self.series.title.text = f"{var_name} at {where}"
+        self.series.yaxis.axis_label = series["units"]
+        if t_index is not None and len(series["x"]):
+            t_index = min(t_index, len(series["x"]) - 1)
+            # Bokeh datetime axes are in milliseconds since the epoch
+            self.cursor.location = float(series["x"][t_index].astype("datetime64[ms]").astype(np.int64))
+
+        has_profile = profile is not None and len(profile["x"]) > 0
+        if has_profile:
+            self.profile_source.data = {"x": profile["values"], "y": profile["x"]}
+            self.profile.title.text = f"{var_name} profile at {where}"
+            self.profile.xaxis.axis_label = profile["units"]
+            self.profile.yaxis.axis_label = profile["dim"]
+        self.profile_pane.visible = has_profile
+        self.pane.visible = True
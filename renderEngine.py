@@ -0,0 +1,207 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from datasetPool import DATASET_POOL
+from datasetScan import DATASET_METADATA
+from era5_plot import plot_png, dataset_path
+from derivedFields import derived_png
+from frameCache import FRAME_CACHE
+
+# Number of frames rendered at once, and whether they run in threads (shared
+# dataset pool, reads serialised by the NetCDF library) or in separate
+# processes (each with its own pool, Agg rendering fully parallel).
+# Threads are the default: in benchmark.py runs process mode was no faster,
+# and it opens every run again in each worker. More workers than cores only
+# added contention, hence one per core.
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", min(8, os.cpu_count() or 1)))
+RENDER_MODE = os.environ.get("RENDER_MODE", "thread")
+# Separate, smaller pool for speculative renders so they never delay a frame
+# the user is waiting for
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", max(1, RENDER_WORKERS // 2)))
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", 4))
+PREFETCH_MB = float(os.environ.get("PREFETCH_MB", 64))
+
+
+def _render_bytes(dataset, t, lev, var_name, vmin=None, vmax=None, derived=None) -> bytes:
+    # Module-level so it can be pickled into a process pool
+    if derived is not None:
+        kind, members, reference = derived
+        return derived_png(kind, members, reference, var_name, t, lev, vmin, vmax).getvalue()
+    return plot_png(dataset=dataset, t=t, lev=lev, var_name=var_name,
+                    vmin=vmin, vmax=vmax).getvalue()
+
+
+def clip_time(dataset, t) -> int:
+    """t limited to the run's time steps, as the frame read does, so out-of-range requests share a key."""
+    ntime = DATASET_METADATA.get(dataset_path(dataset).name, {}).get("ntime")
+    t = int(t)
+    return min(max(t, 0), ntime - 1) if ntime else t
+
+
+def frame_key(dataset, t, lev, var_name, vmin=None, vmax=None, derived=None) -> tuple:
+    """Cache key for a frame; changes when the files of any run it is drawn from change.
+
+    derived is an optional (kind, members, reference) from derivedFields. The
+    key holds only plain values and stable digests, so frames spilled to disk
+    are found again after a restart.
+    """
+    dataset_dir = str(dataset_path(dataset))
+    vmin, vmax = (None if v is None else float(v) for v in (vmin, vmax))
+    key = (dataset_dir, DATASET_POOL.digest(dataset_dir), var_name, clip_time(dataset, t), int(lev),
+           vmin, vmax)
+    if derived is not None:
+        kind, members, reference = derived
+        runs = tuple(members) + ((reference,) if reference else ())
+        key += (derived, tuple(DATASET_POOL.digest(dataset_path(r)) for r in runs))
+    return key
+
+
+class RenderEngine:
+    def __init__(self, workers=RENDER_WORKERS, mode=RENDER_MODE, cache=FRAME_CACHE,
+                 prefetch_workers=PREFETCH_WORKERS):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown render mode '{mode}', expected 'thread' or 'process'")
+        self.workers = workers
+        self.mode = mode
+        self.cache = cache
+        self._inflight = {}
+        self._background = set()
+        # Re-entrant: cancelling a future under the lock runs _finished synchronously
+        self._lock = threading.RLock()
+        if mode == "process":
+            # Spawned, not forked: the server process has threads (and their
+            # locks) that a fork would copy in whatever state they are in
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            self._prefetch_executor = ProcessPoolExecutor(max_workers=prefetch_workers,
+                                                          mp_context=context)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=prefetch_workers,
+                                                         thread_name_prefix="prefetch")
+
+    def submit(self, dataset: str, t: int, lev: int, var_name: str, vmin=None, vmax=None,
+               background=False, derived=None):
+        """Queue one frame; the future resolves to the PNG bytes.
+
+        Cached frames resolve immediately, and identical requests already in
+        flight (e.g. from another session) share one future. background=True
+        queues on the prefetch pool; a foreground request for a frame still
+        waiting there takes it over.
+        """
+        t = clip_time(dataset, t)
+        key = frame_key(dataset, t, lev, var_name, vmin, vmax, derived)
+        if self.cache is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                future = Future()
+                future.set_result(data)
+                return future
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                if background or future not in self._background or not future.cancel():
+                    return future
+            executor = self._prefetch_executor if background else self._executor
+            future = executor.submit(_render_bytes, dataset, t, lev, var_name, vmin, vmax, derived)
+            self._inflight[key] = future
+            if background:
+                self._background.add(future)
+        future.add_done_callback(partial(self._finished, key))
+        return future
+
+    def _finished(self, key, future):
+        with self._lock:
+            self._background.discard(future)
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if self.cache is not None and not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+
+    def cancel(self, future):
+        """Cancel a queued background render; frames someone is waiting for are left alone."""
+        with self._lock:
+            if future in self._background:
+                future.cancel()
+
+    def render(self, dataset: str, t: int, lev: int, var_name: str,
+               vmin=None, vmax=None) -> io.BytesIO:
+        """Render one frame and wait for it."""
+        return io.BytesIO(self.submit(dataset, t, lev, var_name, vmin, vmax).result())
+
+    def render_many(self, requests) -> list[io.BytesIO]:
+        """Render (dataset, t, lev, var_name[, vmin, vmax]) tuples concurrently, results in request order."""
+        futures = [self.submit(*request) for request in requests]
+        return [io.BytesIO(f.result()) for f in futures]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Prefetcher:
+    """Renders the frames around the one on screen in the background.
+
+    Each schedule() call targets t+1..t+depth and t-1 for the current
+    variable and level. Queued renders outside the new window (the user
+    jumped, or changed variable/level) are cancelled. The depth is reduced
+    so that depth * frame_bytes stays within budget_bytes.
+
+    schedule() computes frame keys and looks frames up in the cache, so it
+    is called from a worker thread rather than the event loop.
+    """
+
+    def __init__(self, engine=None, depth=PREFETCH_DEPTH, budget_bytes=int(PREFETCH_MB * 2**20)):
+        self.engine = engine
+        self.depth = depth
+        self.budget_bytes = budget_bytes
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, dataset, t, lev, var_name, ntime, vmin=None, vmax=None, frame_bytes=0,
+                 derived=None):
+        engine = self.engine or RENDER_ENGINE
+        depth = self.depth
+        if frame_bytes:
+            depth = min(depth, self.budget_bytes // frame_bytes)
+        window = [t + i for i in range(1, depth + 1)] + [t - 1]
+        window = [i for i in window if 0 <= i < ntime]
+        wanted = {(dataset, i, lev, var_name, vmin, vmax, derived) for i in window}
+
+        # The lock only guards _pending; keys and cache lookups happen outside it
+        with self._lock:
+            stale = []
+            for request, future in list(self._pending.items()):
+                if request not in wanted or future.done():
+                    if request not in wanted:
+                        stale.append(future)
+                    del self._pending[request]
+        for future in stale:
+            engine.cancel(future)
+
+        for i in window:
+            request = (dataset, i, lev, var_name, vmin, vmax, derived)
+            with self._lock:
+                if request in self._pending:
+                    continue
+            if engine.cache is not None and frame_key(*request) in engine.cache:
+                continue
+            future = engine.submit(*request[:6], background=True, derived=derived)
+            with self._lock:
+                self._pending[request] = future
+
+    def cancel(self):
+        engine = self.engine or RENDER_ENGINE
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            engine.cancel(future)
+
+
+RENDER_ENGINE = RenderEngine()
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+# Modules read these at import: keep caches out of the home directory and
+# point era5_plot at an existing (empty) data directory
+os.environ.setdefault("CREDIT_PANEL_CACHE", tempfile.mkdtemp(prefix="credit-panel-cache-"))
+os.environ.setdefault("MAP_DATA_DIR", tempfile.mkdtemp(prefix="credit-panel-data-"))
+
+# The modules live flat at the top of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def write_step(run_dir, i, nlev=2):
+    """One forecast step as pred_<i>.nc: t2m and T on a 4x8 grid, values offset by 100 * i."""
+    lat = np.array([90.0, 30.0, -30.0, -90.0])
+    lon = np.arange(8) * 45.0
+    t2m = np.arange(32, dtype="float32").reshape(1, 4, 8) + 100 * i
+    T = np.stack([t2m[0] + 10 * k for k in range(nlev)])[None]
+    ds = xr.Dataset(
+        {"t2m": (("time", "latitude", "longitude"), t2m),
+         "T": (("time", "level", "latitude", "longitude"), T)},
+        coords={"time": [pd.Timestamp("2026-01-01") + pd.Timedelta(hours=6 * i)],
+                "latitude": lat, "longitude": lon, "level": np.arange(nlev)})
+    path = Path(run_dir) / f"pred_{i:03d}.nc"
+    ds.to_netcdf(path)
+    return path
+
+
+@pytest.fixture
+def make_run(tmp_path):
+    """make_run(name, steps, start=0) writes steps start..start+steps-1 of a run under tmp_path."""
+    def make(name="run", steps=2, start=0):
+        run_dir = tmp_path / name
+        run_dir.mkdir(exist_ok=True)
+        for i in range(start, start + steps):
+            write_step(run_dir, i)
+        return run_dir
+    return make
@@ -0,0 +1,86 @@
+import pytest
+
+import colorStats
+import datasetPool
+from colorStats import StatsIndex
+from datasetPool import DatasetPool
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    # Fingerprints re-read on every lookup, statistics files under tmp_path
+    monkeypatch.setattr(colorStats, "DATASET_POOL", DatasetPool(check_interval=0))
+    monkeypatch.setattr(datasetPool, "CACHE_DIR", tmp_path / "cache")
+    index = StatsIndex(level_dims=("level",))
+    index.scanned = []
+    file_stats = index._file_stats
+
+    def counting(dataset_dir, name, stamp):
+        index.scanned.append(name)
+        return file_stats(dataset_dir, name, stamp)
+    monkeypatch.setattr(index, "_file_stats", counting)
+    # No background indexing; tests call refresh() themselves
+    monkeypatch.setattr(index, "build", lambda dirs: None)
+    return index
+
+
+def test_aggregate_takes_the_envelope_of_the_files():
+    index = StatsIndex(percentiles=(1, 99))
+    files = {
+        "a.nc": {"vars": {"T": {"min": 1.0, "max": 5.0, "p1": 1.5, "p99": 4.5,
+                                "levels": {"min": [1.0, 2.0], "max": [3.0, 5.0],
+                                           "p1": [1.1, 2.1], "p99": [2.9, 4.9]}}}},
+        "b.nc": {"vars": {"T": {"min": 0.0, "max": 4.0, "p1": 0.5, "p99": 3.5,
+                                "levels": {"min": [0.0, 3.0], "max": [4.0, 4.0],
+                                           "p1": [0.1, 3.1], "p99": [3.9, 3.9]}}}},
+    }
+    T = index._aggregate(files)["T"]
+    assert (T["min"], T["max"], T["p1"], T["p99"]) == (0.0, 5.0, 0.5, 4.5)
+    assert T["levels"]["min"] == [0.0, 2.0]
+    assert T["levels"]["max"] == [4.0, 5.0]
+    assert T["levels"]["p99"] == [3.9, 4.9]
+
+
+def test_refresh_reads_only_new_files(index, make_run):
+    run = make_run("a", steps=2)
+    index.refresh(run)
+    assert index.scanned == ["pred_000.nc", "pred_001.nc"]
+    index.refresh(run)
+    assert len(index.scanned) == 2
+
+    make_run("a", steps=1, start=2)
+    index.refresh(run)
+    assert index.scanned[2:] == ["pred_002.nc"]
+    # Steps are offset by 100; t2m holds 0..31 at step 0
+    assert index.limits(run, "t2m") == (0.0, 231.0)
+    # Level k is offset by 10 * k
+    assert index.limits(run, "T", lev=1) == (10.0, 241.0)
+
+
+def test_statistics_outlive_the_process(index, make_run):
+    run = make_run("a", steps=2)
+    index.refresh(run)
+    restarted = StatsIndex(level_dims=("level",))
+    # Complete without a build
+    assert restarted.indexed(run)
+    assert restarted.limits(run, "t2m") == (0.0, 131.0)
+
+
+def test_limits_before_indexing_read_the_variable(index, make_run):
+    run = make_run("a", steps=2)
+    assert index.limits(run, "T", lev=1) == (10.0, 141.0)
+    assert index.scanned == []
+    with pytest.raises(ValueError):
+        index.limits(run, "missing")
+
+
+def test_limits_use_files_indexed_so_far(index, make_run):
+    run = make_run("a", steps=2)
+    index.refresh(run)
+    make_run("a", steps=1, start=2)
+    # The new step is not indexed yet: the range of the first two stands in
+    assert index.limits(run, "t2m") == (0.0, 131.0)
+    assert not index.indexed(run)
+    index.refresh(run)
+    assert index.indexed(run)
+    assert index.limits(run, "t2m") == (0.0, 231.0)
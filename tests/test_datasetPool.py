@@ -0,0 +1,95 @@
+import os
+
+import datasetPool
+from datasetPool import DatasetPool, extends_fingerprint, fingerprint_digest
+
+OLD = (("a.nc", 1, 10), ("b.nc", 2, 20))
+
+
+def test_appended_files_extend():
+    assert extends_fingerprint(OLD, OLD + (("c.nc", 3, 30),))
+
+
+def test_same_files_do_not_extend():
+    assert not extends_fingerprint(OLD, OLD)
+
+
+def test_changed_or_removed_files_do_not_extend():
+    assert not extends_fingerprint(OLD, (("a.nc", 1, 10), ("b.nc", 5, 20), ("c.nc", 3, 30)))
+    assert not extends_fingerprint(OLD, (("a.nc", 1, 10), ("c.nc", 3, 30), ("d.nc", 4, 40)))
+    assert not extends_fingerprint(OLD, OLD[:1])
+
+
+def test_list_fingerprints_extend():
+    # The metadata scan compares fingerprints read back from JSON, as lists
+    old = [list(f) for f in OLD]
+    assert extends_fingerprint(old, old + [["c.nc", 3, 30]])
+    assert not extends_fingerprint(old, [["a.nc", 1, 10], ["b.nc", 2, 21], ["c.nc", 3, 30]])
+
+
+def test_digest_is_stable_and_tracks_changes():
+    assert fingerprint_digest(OLD) == fingerprint_digest([list(f) for f in OLD])
+    assert fingerprint_digest(OLD) != fingerprint_digest(OLD + (("c.nc", 3, 30),))
+    assert len(fingerprint_digest(OLD)) == 16
+
+
+def _count_closes(ds, closed):
+    close = ds._close
+    ds.set_close(lambda: (closed.append(ds), close and close()))
+
+
+def test_pool_shares_one_open_dataset(make_run):
+    run = make_run("a")
+    pool = DatasetPool(check_interval=0)
+    with pool.acquire(run) as first, pool.acquire(run) as second:
+        assert first is second
+        assert pool._entries[str(run)].refcount == 2
+    assert pool._entries[str(run)].refcount == 0
+
+
+def test_changed_files_retire_the_dataset_once_released(make_run):
+    run = make_run("a")
+    pool = DatasetPool(check_interval=0)
+    closed = []
+    with pool.acquire(run) as old:
+        _count_closes(old, closed)
+        # Rewritten in place: not an append, so the run is reopened
+        st = os.stat(run / "pred_000.nc")
+        os.utime(run / "pred_000.nc", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        with pool.acquire(run) as new:
+            assert new is not old
+        # Still in use by the outer block
+        assert closed == []
+    assert closed == [old]
+
+
+def test_least_recently_used_run_is_evicted(make_run):
+    pool = DatasetPool(max_datasets=1, check_interval=0)
+    closed = []
+    with pool.acquire(make_run("a")) as ds:
+        _count_closes(ds, closed)
+    run_b = make_run("b")
+    with pool.acquire(run_b):
+        pass
+    assert list(pool._entries) == [str(run_b)]
+    assert closed == [ds]
+
+
+def test_appended_files_extend_the_open_dataset(make_run, monkeypatch):
+    run = make_run("a", steps=2)
+    pool = DatasetPool(check_interval=0, append_dim="time")
+    with pool.acquire(run) as old:
+        make_run("a", steps=1, start=2)
+        with pool.acquire(run) as new:
+            assert new.sizes["time"] == 3
+            assert float(new.t2m.isel(time=2).min()) == 200.0
+        assert pool._entries[str(run)].appends == 1
+        # Borrowers of the previous dataset can still read it
+        assert float(old.t2m.isel(time=1).min()) == 100.0
+
+    # Past the append limit the run is reopened with a flat graph
+    monkeypatch.setattr(datasetPool, "POOL_MAX_APPENDS", 1)
+    make_run("a", steps=1, start=3)
+    with pool.acquire(run) as ds:
+        assert ds.sizes["time"] == 4
+    assert pool._entries[str(run)].appends == 0
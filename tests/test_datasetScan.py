@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import datasetScan
+from datasetScan import scan_datasets
+
+
+@pytest.fixture
+def scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(datasetScan, "METADATA_CACHE", tmp_path / "metadata.json")
+    full_scans = []
+    scan_dataset = datasetScan.scan_dataset
+
+    def counting(path):
+        full_scans.append(path.name)
+        return scan_dataset(path)
+    monkeypatch.setattr(datasetScan, "scan_dataset", counting)
+
+    def run(data_dir, metadata):
+        return scan_datasets(data_dir, metadata, mode="thread")
+    run.full_scans = full_scans
+    return run
+
+
+def test_unchanged_runs_come_from_the_cache(scan, make_run, tmp_path):
+    make_run("a", steps=2)
+    assert scan(tmp_path, {}) == ["a"]
+    metadata = {}
+    assert scan(tmp_path, metadata) == []
+    assert scan.full_scans == ["a"]
+    assert metadata["a"]["ntime"] == 2 and metadata["a"]["vars3d"] == ["T"]
+
+
+def test_appended_files_extend_the_metadata(scan, make_run, tmp_path):
+    make_run("a", steps=2)
+    metadata = {}
+    scan(tmp_path, metadata)
+    make_run("a", steps=2, start=2)
+    assert scan(tmp_path, metadata) == ["a"]
+    # Only the new files' time coordinates were read
+    assert scan.full_scans == ["a"]
+    assert metadata["a"]["ntime"] == 4
+    assert metadata["a"]["stime"] == "2026-01-01T00:00:00"
+    assert metadata["a"]["etime"] == "2026-01-01T18:00:00"
+
+
+def test_rewritten_files_rescan_the_run(scan, make_run, tmp_path):
+    run = make_run("a", steps=2)
+    metadata = {}
+    scan(tmp_path, metadata)
+    st = os.stat(run / "pred_000.nc")
+    os.utime(run / "pred_000.nc", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert scan(tmp_path, metadata) == ["a"]
+    assert scan.full_scans == ["a", "a"]
+
+
+def test_removed_runs_are_dropped(scan, make_run, tmp_path):
+    run = make_run("a", steps=1)
+    metadata = {}
+    scan(tmp_path, metadata)
+    (run / "pred_000.nc").unlink()
+    run.rmdir()
+    scan(tmp_path, metadata)
+    assert "a" not in metadata
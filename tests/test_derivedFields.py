@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import derivedFields
+from derivedFields import _compute
+
+RUNS = {
+    "a": np.array([[1.0, 2.0], [np.nan, 4.0]], dtype="float32"),
+    "b": np.array([[3.0, 2.0], [np.nan, 0.0]], dtype="float32"),
+    "ref": np.array([[1.0, 1.0], [np.nan, 1.0]], dtype="float32"),
+}
+
+
+@pytest.fixture(autouse=True)
+def frames(monkeypatch):
+    def read_frame(run, t, lev, var_name):
+        return {"arr": RUNS[run], "extent": [-180.0, 180.0, -90.0, 90.0],
+                "title": f"{var_name} (Temperature) - t={t} - 2026-01-01 18:00 UTC", "units": "K"}
+    monkeypatch.setattr(derivedFields, "read_frame", read_frame)
+
+
+def test_difference_is_first_member_minus_reference():
+    frame = _compute("difference", ("a",), "ref", "T", 3, 0)
+    np.testing.assert_array_equal(frame["arr"], [[0.0, 1.0], [np.nan, 3.0]])
+    assert frame["title"] == "T a - ref - t=3 - 2026-01-01 18:00 UTC"
+    assert frame["units"] == "K" and frame["arr"].dtype == np.float32
+
+
+def test_mean_and_std_across_members():
+    np.testing.assert_array_equal(_compute("mean", ("a", "b"), None, "T", 0, 0)["arr"],
+                                  [[2.0, 2.0], [np.nan, 2.0]])
+    np.testing.assert_array_equal(_compute("std", ("a", "b"), None, "T", 0, 0)["arr"],
+                                  [[1.0, 0.0], [np.nan, 2.0]])
+
+
+def test_rmse_against_reference():
+    arr = _compute("rmse", ("a", "b"), "ref", "T", 0, 0)["arr"]
+    np.testing.assert_allclose(arr, [[np.sqrt(2.0), 1.0], [np.nan, np.sqrt(5.0)]])
+
+
+def test_runs_on_different_grids_are_refused(monkeypatch):
+    monkeypatch.setitem(RUNS, "ref", np.zeros((3, 2), dtype="float32"))
+    with pytest.raises(ValueError, match="different grid"):
+        _compute("difference", ("a",), "ref", "T", 0, 0)
+
+
+def test_unknown_kind_is_refused():
+    with pytest.raises(ValueError, match="Unknown derived field"):
+        _compute("median", ("a", "b"), None, "T", 0, 0)
+
+
+class FakeStats:
+    def __init__(self, indexed):
+        self._indexed = indexed
+
+    def shared_limits(self, dirs, var_name, lev=None, percentile=False):
+        return 200.0, 260.0
+
+    def indexed(self, dataset_dir):
+        return self._indexed
+
+
+@pytest.mark.parametrize("kind, limits", [("difference", (-60.0, 60.0)), ("mean", (200.0, 260.0)),
+                                          ("std", (0.0, 30.0)), ("rmse", (0.0, 60.0))])
+def test_limits_come_from_the_runs_statistics(monkeypatch, kind, limits):
+    monkeypatch.setattr(derivedFields, "STATS_INDEX", FakeStats(indexed=True))
+    monkeypatch.setattr(derivedFields, "_LIMITS", derivedFields.OrderedDict())
+    assert derivedFields.derived_limits(kind, ("a",), "ref", "T", 0) == limits
+    assert len(derivedFields._LIMITS) == 1
+
+
+def test_limits_of_runs_being_indexed_are_not_kept(monkeypatch):
+    monkeypatch.setattr(derivedFields, "STATS_INDEX", FakeStats(indexed=False))
+    monkeypatch.setattr(derivedFields, "_LIMITS", derivedFields.OrderedDict())
+    derivedFields.derived_limits("difference", ("a",), "ref", "T", 0)
+    assert not derivedFields._LIMITS
@@ -0,0 +1,60 @@
+from frameCache import FrameCache
+
+
+def test_lru_stays_within_max_bytes():
+    cache = FrameCache(max_bytes=10, spill_dir=None)
+    cache.put("a", b"xxxx")
+    cache.put("b", b"yyyy")
+    cache.get("a")
+    cache.put("c", b"zzzz")
+    assert cache.nbytes == 8
+    assert "b" not in cache
+    assert cache.get("a") == b"xxxx" and cache.get("c") == b"zzzz"
+
+
+def test_frame_larger_than_cache_is_not_kept():
+    cache = FrameCache(max_bytes=4, spill_dir=None)
+    cache.put("a", b"12345")
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_evicted_frames_spill_and_come_back(tmp_path):
+    cache = FrameCache(max_bytes=4, spill_dir=tmp_path, max_spill_bytes=100)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert len(list(tmp_path.glob("*.png"))) == 1
+    assert cache.spill_nbytes == 4
+    assert cache.get("a") == b"aaaa"
+    # Read back into memory, which spills "b" in its place
+    assert cache.get("b") == b"bbbb"
+    assert len(list(tmp_path.glob("*.png"))) == 1
+
+
+def test_spill_budget_drops_oldest(tmp_path):
+    cache = FrameCache(max_bytes=4, spill_dir=tmp_path, max_spill_bytes=8)
+    for key in "abcd":
+        cache.put(key, key.encode() * 4)
+    assert cache.spill_nbytes == 8
+    assert "a" not in cache
+    assert "b" in cache and "c" in cache
+
+
+def test_spill_is_found_again_after_restart(tmp_path):
+    key = ("/runs/a", "0123456789abcdef", "t2m", 3, 0)
+    cache = FrameCache(max_bytes=4, spill_dir=tmp_path)
+    cache.put(key, b"png1")
+    cache.put("other", b"png2")
+
+    restarted = FrameCache(max_bytes=4, spill_dir=tmp_path)
+    assert restarted.spill_nbytes == 4
+    assert key in restarted
+    assert restarted.get(key) == b"png1"
+
+
+def test_clear_removes_spill_files(tmp_path):
+    cache = FrameCache(max_bytes=4, spill_dir=tmp_path)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.clear()
+    assert list(tmp_path.glob("*.png")) == []
+    assert cache.nbytes == cache.spill_nbytes == 0
@@ -0,0 +1,57 @@
+import numpy as np
+
+from gridGeometry import GridGeometry, PointIndex
+
+
+def test_apply_rolls_0_360_longitudes_and_flips_latitude():
+    lon = np.arange(0, 360, 90.0)  # 0, 90, 180, 270
+    lat = np.array([45.0, -45.0])
+    grid = GridGeometry.from_coords(lon, lat)
+    assert grid.lat_flip and grid.lon_order is None
+    raw = np.array([[0, 1, 2, 3], [10, 11, 12, 13]], dtype="int16")
+    out = grid.apply(raw)
+    # South first; columns ordered -180, -90, 0, 90
+    np.testing.assert_array_equal(out, [[12, 13, 10, 11], [2, 3, 0, 1]])
+    assert out.dtype == np.float32
+    assert grid.extent == [-180.0, 90.0, -45.0, 45.0]
+
+
+def test_apply_reorders_unsorted_longitudes():
+    lon = np.array([90.0, 0.0, 270.0, 180.0])
+    lat = np.array([-45.0, 45.0])
+    grid = GridGeometry.from_coords(lon, lat)
+    assert not grid.lat_flip and grid.lon_order is not None
+    raw = np.array([[1.0, 2.0, 3.0, 4.0], [5.0, 6.0, 7.0, 8.0]])
+    np.testing.assert_array_equal(grid.apply(raw), [[4.0, 3.0, 2.0, 1.0], [8.0, 7.0, 6.0, 5.0]])
+
+
+def test_apply_masks_fill_values_without_touching_input():
+    grid = GridGeometry.from_coords([-90.0, 90.0], [0.0, 1.0])
+    raw = np.array([[1.0, 1e30], [np.nan, 2.0]])
+    out = grid.apply(raw, fill_threshold=1e20)
+    assert np.isnan(out[0, 1]) and np.isnan(out[1, 0])
+    assert out[0, 0] == 1.0 and out[1, 1] == 2.0
+    assert raw[0, 1] == 1e30
+
+
+def test_dict_round_trip():
+    grid = GridGeometry.from_coords([90.0, 0.0, 270.0, 180.0], [1.0, 0.0])
+    copy = GridGeometry.from_dict(grid.to_dict())
+    raw = np.arange(8.0).reshape(2, 4)
+    np.testing.assert_array_equal(copy.apply(raw), grid.apply(raw))
+
+
+def test_point_index_nearest():
+    index = PointIndex(np.arange(0, 360, 10.0), np.array([30.0, 20.0, 10.0, 0.0]))
+    assert index.nearest(21.0, 42.0) == (1, 4)
+    # Negative longitudes are matched against 0..360 coordinates
+    assert index.nearest(0.0, -10.0) == (3, 35)
+
+
+def test_point_index_wraps_across_the_date_line():
+    index = PointIndex(np.arange(0, 360, 10.0), np.array([0.0]))
+    # 358 and -2 are both 2 degrees from 0 but 8 from 350
+    assert index.nearest(0.0, 358.0) == (0, 0)
+    assert index.nearest(0.0, -2.0) == (0, 0)
+    assert index.nearest(0.0, 176.0) == (0, 18)
+    assert index.nearest(0.0, -176.0) == (0, 18)
@@ -0,0 +1,57 @@
+import threading
+
+from jobQueue import Job, JobQueue
+
+
+def test_lines_since_returns_only_new_lines():
+    job = Job(1, "true", buffer_lines=10)
+    for i in range(3):
+        job.append(f"line {i}")
+    seq, lines = job.lines_since(0)
+    assert seq == 3 and lines == ["line 0", "line 1", "line 2"]
+    job.append("line 3")
+    assert job.lines_since(seq) == (4, ["line 3"])
+    assert job.lines_since(4) == (4, [])
+
+
+def test_lines_since_skips_lines_dropped_from_the_buffer():
+    job = Job(1, "true", buffer_lines=3)
+    for i in range(5):
+        job.append(f"line {i}")
+    assert job.lines_since(0) == (5, ["line 2", "line 3", "line 4"])
+    assert job.lines_since(1) == (5, ["line 2", "line 3", "line 4"])
+    assert job.lines_since(3) == (5, ["line 3", "line 4"])
+
+
+def test_lines_since_a_future_cursor_is_empty():
+    job = Job(1, "true", buffer_lines=3)
+    job.append("only")
+    assert job.lines_since(7) == (1, [])
+
+
+def test_search_reads_the_full_log(tmp_path):
+    log = tmp_path / "1.log"
+    log.write_text("Epoch 1\nloss nan\nEpoch 2\nLOSS 0.1\n")
+    job = Job(1, "true", log_path=log)
+    assert job.search("loss") == [(2, "loss nan"), (4, "LOSS 0.1")]
+    assert job.search("epoch", limit=1) == [(1, "Epoch 1")]
+
+
+def test_active_while_jobs_are_submitted(tmp_path):
+    queue = JobQueue(workers=1, log_dir=tmp_path)
+    errors = []
+
+    def poll():
+        for _ in range(2000):
+            try:
+                queue.active()
+            except RuntimeError as e:
+                errors.append(e)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    for _ in range(200):
+        queue.submit("true")
+    poller.join()
+    assert errors == []
+    assert len(queue.all_jobs()) == 200
@@ -0,0 +1,71 @@
+import numpy as np
+import xarray as xr
+
+import datasetPool
+from gridGeometry import GridGeometry
+from previewCache import PreviewCache, PreviewStore, block_mean, coarsen
+
+
+def test_block_mean_averages_2x2_blocks():
+    arr = np.arange(16, dtype="float32").reshape(4, 4)
+    np.testing.assert_array_equal(block_mean(arr), [[2.5, 4.5], [10.5, 12.5]])
+
+
+def test_block_mean_ignores_nan():
+    arr = np.array([[1.0, np.nan], [3.0, np.nan]], dtype="float32")
+    out = block_mean(arr)
+    assert out.shape == (1, 1) and out[0, 0] == 2.0
+
+
+def test_block_mean_all_nan_block_stays_nan():
+    arr = np.full((2, 2), np.nan, dtype="float32")
+    assert np.isnan(block_mean(arr)[0, 0])
+
+
+def test_block_mean_pads_odd_edges():
+    arr = np.arange(9, dtype="float64").reshape(3, 3)
+    out = block_mean(arr)
+    assert out.shape == (2, 2) and out.dtype == np.float64
+    # Edge blocks average only the cells that exist
+    np.testing.assert_array_equal(out, [[2.0, 3.5], [6.5, 8.0]])
+
+
+def test_coarsen_stops_at_max_cells():
+    out = coarsen(np.ones((100, 200)), 64)
+    assert out.shape == (25, 50) and out.dtype == np.float32
+
+
+def test_preview_cache_is_bounded():
+    cache = PreviewCache(max_cells=4, max_items=2)
+    for key in "abc":
+        cache.put(key, np.ones((8, 8)))
+    assert "a" not in cache
+    assert cache.get("b").shape == (4, 4)
+    assert cache.png("c", 0.0, 2.0).startswith(b"\x89PNG")
+    assert cache.png("missing", 0.0, 1.0) is None
+
+
+def _run_file(ntime):
+    values = np.arange(ntime * 2 * 4 * 8, dtype="float32").reshape(ntime, 2, 4, 8)
+    return xr.Dataset(
+        {"T": (("time", "level", "latitude", "longitude"), values),
+         "t2m": (("time", "latitude", "longitude"), values[:, 0])},
+        coords={"latitude": [90.0, 30.0, -30.0, -90.0], "longitude": np.arange(8) * 45.0})
+
+
+def test_preview_store_reads_slices_across_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(datasetPool, "CACHE_DIR", tmp_path)
+    store = PreviewStore(max_cells=4)
+    files = [("a.nc", 1.0, 10, _run_file(2)), ("b.nc", 2.0, 10, _run_file(3))]
+    for name, mtime, size, ds in files:
+        grid = GridGeometry.from_coords(ds.longitude.values, ds.latitude.values)
+        store.write("/runs/r", name, [mtime, size], ds, grid)
+    fingerprint = [(name, mtime, size) for name, mtime, size, _ in files]
+
+    # Step 3 of the run is step 1 of the second file, coarsened to 2x4 and flipped south up
+    expected = coarsen(grid.apply(files[1][3].T.values[1, 1]), 4)
+    np.testing.assert_array_equal(store.read("/runs/r", fingerprint, "T", 3, lev=1), expected)
+    assert store.read("/runs/r", fingerprint, "t2m", 0).shape == (2, 4)
+    assert store.read("/runs/r", fingerprint, "T", 5) is None
+    # A rewritten file is not previewed from its old copy
+    assert store.read("/runs/r", [("a.nc", 1.0, 10), ("b.nc", 3.0, 10)], "T", 3) is None
@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import renderEngine
+from renderEngine import Prefetcher, RenderEngine
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    # Frames "render" to their time index once released; keys are the request itself
+    release = threading.Event()
+    started = threading.Event()
+
+    def render(dataset, t, lev, var_name, vmin=None, vmax=None, derived=None):
+        started.set()
+        release.wait(5)
+        return bytes([t])
+    monkeypatch.setattr(renderEngine, "_render_bytes", render)
+    monkeypatch.setattr(renderEngine, "frame_key", lambda *request: request[:6])
+    engine = RenderEngine(workers=1, mode="thread", cache=None, prefetch_workers=1)
+    engine.release, engine.started = release, started
+    yield engine
+    release.set()
+    engine.shutdown()
+
+
+def test_foreground_request_takes_over_a_queued_prefetch(engine):
+    busy = engine.submit("run", 0, 0, "t2m", background=True)
+    queued = engine.submit("run", 1, 0, "t2m", background=True)
+    wanted = engine.submit("run", 1, 0, "t2m")
+    assert wanted is not queued
+    assert queued.cancelled()
+    engine.release.set()
+    assert wanted.result(5) == bytes([1])
+    assert busy.result(5) == bytes([0])
+
+
+def test_foreground_request_shares_a_running_prefetch(engine):
+    running = engine.submit("run", 0, 0, "t2m", background=True)
+    assert engine.started.wait(5)
+    # Already rendering: cancelling it would only waste the work
+    assert engine.submit("run", 0, 0, "t2m") is running
+    engine.release.set()
+    assert running.result(5) == bytes([0])
+
+
+def test_identical_requests_share_one_render(engine):
+    first = engine.submit("run", 0, 0, "t2m")
+    assert engine.submit("run", 0, 0, "t2m") is first
+    assert engine.submit("run", 0, 0, "t2m", background=True) is first
+
+
+def test_cancel_leaves_foreground_frames_alone(engine):
+    blocker = engine.submit("run", 0, 0, "t2m")
+    waiting = engine.submit("run", 1, 0, "t2m")
+    engine.submit("run", 2, 0, "t2m", background=True)
+    prefetch = engine.submit("run", 3, 0, "t2m", background=True)
+    engine.cancel(waiting)
+    engine.cancel(prefetch)
+    assert not waiting.cancelled()
+    assert prefetch.cancelled()
+    engine.release.set()
+    assert [f.result(5) for f in (blocker, waiting)] == [bytes([0]), bytes([1])]
+
+
+class FakeEngine:
+    def __init__(self, cached=()):
+        self.cache = set(cached)
+        self.submitted = []
+        self.cancelled = []
+
+    def submit(self, dataset, t, lev, var_name, vmin=None, vmax=None, background=False, derived=None):
+        self.submitted.append(t)
+        return Future()
+
+    def cancel(self, future):
+        self.cancelled.append(future)
+
+
+@pytest.fixture
+def plain_keys(monkeypatch):
+    monkeypatch.setattr(renderEngine, "frame_key", lambda *request: request[:6])
+
+
+def test_prefetch_window_follows_the_playhead(plain_keys):
+    engine = FakeEngine()
+    prefetcher = Prefetcher(engine, depth=3)
+    prefetcher.schedule("run", 5, 0, "t2m", ntime=8)
+    assert engine.submitted == [6, 7, 4]
+
+    # Jumped back: frames outside the new window are cancelled, the rest kept
+    prefetcher.schedule("run", 3, 0, "t2m", ntime=8)
+    assert engine.submitted[3:] == [5, 2]
+    assert len(engine.cancelled) == 1
+    assert sorted(request[1] for request in prefetcher._pending) == [2, 4, 5, 6]
+
+
+def test_prefetch_depth_stays_within_budget(plain_keys):
+    engine = FakeEngine()
+    prefetcher = Prefetcher(engine, depth=4, budget_bytes=2000)
+    prefetcher.schedule("run", 0, 0, "t2m", ntime=10, frame_bytes=1000)
+    assert engine.submitted == [1, 2]
+
+
+def test_prefetch_skips_cached_frames_and_cancel_drops_the_rest(plain_keys):
+    engine = FakeEngine(cached=[("run", 2, 0, "t2m", None, None)])
+    prefetcher = Prefetcher(engine, depth=2)
+    prefetcher.schedule("run", 1, 0, "t2m", ntime=10)
+    assert engine.submitted == [3, 0]
+    prefetcher.cancel()
+    assert len(engine.cancelled) == 2 and not prefetcher._pending
@@ -0,0 +1,72 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from era5_plot import read_frame, slice_key
+from previewCache import PREVIEW_CACHE, block_mean
+
+# Number of 2D slices whose pyramids are kept in memory
+PYRAMID_CACHE_SIZE = int(os.environ.get("PYRAMID_CACHE_SIZE", 32))
+
+
+class SlicePyramid:
+    """A 2D slice plus successively 2x coarser block-averaged copies.
+
+    window() returns the part of the slice inside a viewport at the coarsest
+    level that still has about one cell per screen pixel, so a zoomed-in
+    region costs about the same as the global overview.
+    """
+
+    def __init__(self, frame: dict, min_size=64):
+        arr = np.asarray(frame["arr"], dtype="float32")
+        x0, x1, y0, y1 = frame["extent"]
+        self.title = frame["title"]
+        self.units = frame["units"]
+        self.x0, self.y0 = x0, y0
+        # Cell sizes, treating the extent as cell edges like imshow does
+        dx, dy = (x1 - x0) / arr.shape[1], (y1 - y0) / arr.shape[0]
+        self.levels = [(arr, dx, dy)]
+        while min(arr.shape) > min_size:
+            arr = block_mean(arr)
+            dx, dy = dx * 2, dy * 2
+            self.levels.append((arr, dx, dy))
+
+    def window(self, vx0, vx1, vy0, vy1, max_nx, max_ny):
+        """(array, (x0, x1, y0, y1), level) covering the viewport with at most max_nx x max_ny cells."""
+        for level, (arr, dx, dy) in enumerate(self.levels):
+            i0 = max(0, int(np.floor((vx0 - self.x0) / dx)))
+            i1 = min(arr.shape[1], int(np.ceil((vx1 - self.x0) / dx)))
+            j0 = max(0, int(np.floor((vy0 - self.y0) / dy)))
+            j1 = min(arr.shape[0], int(np.ceil((vy1 - self.y0) / dy)))
+            if (i1 - i0) <= max_nx and (j1 - j0) <= max_ny:
+                break
+        i1, j1 = max(i1, i0 + 1), max(j1, j0 + 1)
+        extent = (self.x0 + i0 * dx, self.x0 + i1 * dx, self.y0 + j0 * dy, self.y0 + j1 * dy)
+        return arr[j0:j1, i0:i1], extent, level
+
+
+_PYRAMIDS = OrderedDict()
+_PYRAMIDS_LOCK = threading.Lock()
+
+
+def get_pyramid(dataset: str, t: int, lev: int, var_name: str) -> SlicePyramid:
+    """Pyramid for one slice, shared across sessions and rebuilt when the run's files change."""
+    key = slice_key(dataset, t, lev, var_name)
+    with _PYRAMIDS_LOCK:
+        pyramid = _PYRAMIDS.get(key)
+        if pyramid is not None:
+            _PYRAMIDS.move_to_end(key)
+            return pyramid
+
+    pyramid = SlicePyramid(read_frame(dataset, t, lev, var_name))
+    # Its coarse levels double as the PNG backend's preview of this slice
+    coarse = next((arr for arr, _, _ in pyramid.levels if max(arr.shape) <= PREVIEW_CACHE.max_cells),
+                  pyramid.levels[-1][0])
+    PREVIEW_CACHE.put(key, coarse)
+    with _PYRAMIDS_LOCK:
+        _PYRAMIDS[key] = pyramid
+        while len(_PYRAMIDS) > PYRAMID_CACHE_SIZE:
+            _PYRAMIDS.popitem(last=False)
+    return pyramid